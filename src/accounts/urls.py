@@ -1,5 +1,5 @@
 from django.conf.urls import url
-from django.views.decorators.cache import cache_page # per-view cache
+from django.views.decorators.cache import never_cache # shared fragments are cached instead
 
 from . import views
 
@@ -12,10 +12,10 @@ urlpatterns = [
     views.UserEnrollCourseView.as_view(),
     name='user-enroll-course'),
     url(r'^course/(?P<pk>\d+)/(?P<module_id>\d+)/$',
-    cache_page(60 * 15)(views.UserCourseDetailView.as_view()),
+    never_cache(views.UserCourseDetailView.as_view()),
     name='user-course-detail-module'),
     url(r'^course/(?P<pk>\d+)/$',
-    cache_page(60 * 15)(views.UserCourseDetailView.as_view()),
+    never_cache(views.UserCourseDetailView.as_view()),
     name='user-course-detail'),
     url(r'^courses/$',
     views.UserCourseListView.as_view(),
@@ -1,4 +1,8 @@
+from django.core.cache import cache
 from django.core.urlresolvers import reverse_lazy
+from django.http import Http404
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.views.generic.list import ListView
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, FormView
@@ -10,6 +14,9 @@ from braces.views import LoginRequiredMixin
 from .forms import CourseEnrollForm
 
 from courses.models import Course
+from courses.instrumentation import record_cache
+from courses.cache import (get_enrolled_course_ids, get_generations,
+                            FRAGMENT_CACHE_TIMEOUT)
 
 
 class UserCourseListView(LoginRequiredMixin, ListView):
@@ -22,7 +29,7 @@ class UserCourseListView(LoginRequiredMixin, ListView):
         '''
 
         qs = super(UserCourseListView, self).get_queryset()
-        return qs.filter(users__in=[self.request.user])
+        return qs.filter(id__in=get_enrolled_course_ids(self.request.user))
 
 
 class UserCourseDetailView(LoginRequiredMixin, DetailView):
@@ -35,7 +42,9 @@ class UserCourseDetailView(LoginRequiredMixin, DetailView):
         '''
 
         qs = super(UserCourseDetailView, self).get_queryset()
-        return qs.filter(users__in=[self.request.user])
+        if int(self.kwargs['pk']) not in get_enrolled_course_ids(self.request.user):
+            return qs.none()
+        return qs
 
     def get_context_data(self, **kwargs):
         '''
@@ -44,15 +53,48 @@ class UserCourseDetailView(LoginRequiredMixin, DetailView):
 
         context = super(UserCourseDetailView, self).get_context_data(**kwargs)
         # get course object
-        course = self.get_object()
+        course = self.object
         if 'module_id' in self.kwargs:
             # get current module if module_id URL parameter is given
-            context['module'] = course.modules.get(id=self.kwargs['module_id'])
+            module_id = int(self.kwargs['module_id'])
         else:
             # or get the first module of the course
-            context['module'] = course.modules.all()[0]
+            module_id = self.get_first_module_id(course)
+        context['module_contents'] = self.get_module_contents(course, module_id)
         return context
 
+    def get_first_module_id(self, course):
+        generation, = get_generations('course_{}'.format(course.id))
+        key = 'course_{}_first_module_{}'.format(course.id, generation)
+        module_id = cache.get(key)
+        if module_id is None:
+            module_id = course.modules.values_list('id', flat=True).first() or 0
+            cache.set(key, module_id, FRAGMENT_CACHE_TIMEOUT)
+        return module_id
+
+    def get_module_contents(self, course, module_id):
+        '''
+        renders the module navigation and the contents of the
+        module, which are the same for every enrolled user and
+        cached until the course modules or the module contents change
+        '''
+
+        generations = get_generations('course_{}'.format(course.id),
+                                        'module_{}'.format(module_id))
+        key = 'course_{}_module_{}_{}_{}'.format(course.id, module_id, *generations)
+        html = cache.get(key)
+        record_cache('fragment', hits=html is not None, misses=html is None)
+        if html is None:
+            # the navigation lists the modules, the selected one among them
+            modules = list(course.modules.all())
+            module = next((module for module in modules if module.id == module_id), None)
+            if module_id and module is None:
+                raise Http404('No module matches the given query.')
+            html = render_to_string('accounts/course/module.html',
+                                    {'object': course, 'modules': modules, 'module': module})
+            cache.set(key, html, FRAGMENT_CACHE_TIMEOUT)
+        return mark_safe(html)
+
 
 class UserEnrollCourseView(LoginRequiredMixin, FormView):
     course = None
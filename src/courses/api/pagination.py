@@ -0,0 +1,16 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CourseCursorPagination(CursorPagination):
+    '''
+    courses are paginated following their
+    default ordering, using the id to break ties
+    '''
+
+    ordering = ('-created', '-id')
+    page_size = 20
+
+
+class SubjectCursorPagination(CursorPagination):
+    ordering = ('title', 'id')
+    page_size = 50
@@ -0,0 +1,21 @@
+import io
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from ..enrollment import read_users
+
+
+class UsersCSVParser(BaseParser):
+    '''
+    a CSV file of users, with an id or a username column
+    '''
+
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        try:
+            return {'users': read_users(io.StringIO(stream.read().decode(encoding)))}
+        except (ValueError, UnicodeDecodeError) as e:
+            raise ParseError(str(e))
@@ -1,6 +1,8 @@
 from rest_framework.permissions import BasePermission
 
+from ..cache import get_enrolled_course_ids
+
 
 class IsEnrolled(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.users.filter(id=request.user.id).exists()
+        return obj.id in get_enrolled_course_ids(request.user)
@@ -38,6 +38,21 @@ class ModuleSerializer(serializers.ModelSerializer):
         fields = ['order', 'title', 'description']
 
 
+class CourseHeaderSerializer(serializers.ModelSerializer):
+    '''
+    Course fields sent before the modules
+    when streaming the contents of a course
+    '''
+
+    class Meta:
+        model = Course
+        fields = ['id', 'subject',
+                    'title', 'slug',
+                    'overview', 'created',
+                    'owner'
+                    ]
+
+
 class CourseWithContentSerializer(serializers.ModelSerializer):
     modules = ModuleWithContentSerializer(many=True)
 
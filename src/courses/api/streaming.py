@@ -0,0 +1,60 @@
+'''
+streams the contents of a course as JSON, a chunk of
+modules at a time, so that the memory used by a response is
+bounded by a chunk instead of the whole course.
+each chunk is rendered by the renderer of the API, and the
+first one before the response is sent, so an error while
+loading the course is still answered with an error status
+'''
+
+from django.conf import settings
+
+from rest_framework.renderers import JSONRenderer
+
+from ..cache import render_items
+from ..models import Module
+from .serializers import CourseHeaderSerializer, ModuleWithContentSerializer
+
+
+MODULES_PER_CHUNK = getattr(settings, 'API_STREAM_MODULES_PER_CHUNK', 20)
+
+
+def render(data):
+    return JSONRenderer().render(data)
+
+
+def iter_module_chunks(module_ids, context=None, chunk_size=MODULES_PER_CHUNK):
+    '''
+    the modules rendered by chunks, each chunk loaded with
+    its contents and items by its own few queries and released
+    once it is rendered
+    '''
+
+    for start in range(0, len(module_ids), chunk_size):
+        chunk = list(Module.objects.filter(id__in=module_ids[start:start + chunk_size])
+                                    .with_contents())
+        render_items(content.item for module in chunk for content in module.contents.all())
+        # the items of the list, without its brackets
+        data = render(ModuleWithContentSerializer(chunk, many=True, context=context).data)
+        # the modules are not held while the chunk is sent
+        del chunk
+        yield data[1:-1]
+
+
+def iter_course_contents(course, context=None, chunk_size=MODULES_PER_CHUNK):
+    '''
+    yields the same document as the CourseWithContentSerializer:
+    the course header along with the first modules, then the
+    following modules and the end of the document
+    '''
+
+    header = dict(CourseHeaderSerializer(course, context=context).data, modules=[])
+    # the empty list of modules comes last, it is filled by the chunks
+    opening, closing = render(header).rsplit(b'[]', 1)
+    # only the ids of the modules are kept for the whole response
+    chunks = iter_module_chunks(list(course.modules.values_list('id', flat=True)),
+                                context, chunk_size)
+    yield opening + b'[' + next(chunks, b'')
+    for chunk in chunks:
+        yield b',' + chunk
+    yield b']' + closing
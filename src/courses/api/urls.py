@@ -15,5 +15,11 @@ urlpatterns = [url(r'^subjects/$',
                 url(r'^subjects/(?P<pk>\d+)/$',
                     views.SubjectDetailView.as_view(),
                     name ='subject-detail'),
+                url(r'^search/$',
+                    views.SearchView.as_view(),
+                    name='search'),
+                url(r'^instrumentation/$',
+                    views.InstrumentationView.as_view(),
+                    name='instrumentation'),
                 url(r'', include(router.urls))
                 ]
@@ -1,21 +1,37 @@
+import itertools
+
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
 from rest_framework import generics
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.authentication import BasicAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework import viewsets
-from rest_framework.decorators import detail_route
+from rest_framework.decorators import detail_route, list_route
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.parsers import JSONParser
 
-from ..models import Subject, Course
+from ..models import Subject, Course, Module
+from ..cache import render_items
+from ..enrollment import (parse_identifier, parse_argument, resolve_courses,
+                            resolve_users, enroll_users)
+from ..search import search_courses
+from ..routers import ReplicaReadAPIMixin
+from ..instrumentation import (InstrumentedAPIMixin,
+                                get_aggregates, reset_aggregates)
 from .serializers import (SubjectSerializer,
                             CourseSerializer,
                             CourseWithContentSerializer)
+from .parsers import UsersCSVParser
 from .permissions import IsEnrolled
+from .pagination import CourseCursorPagination, SubjectCursorPagination
+from .streaming import iter_course_contents
 
 
-class CourseViewSet(viewsets.ReadOnlyModelViewSet):
+class CourseViewSet(InstrumentedAPIMixin, ReplicaReadAPIMixin, viewsets.ReadOnlyModelViewSet):
     '''
     API viewset to both list objects
     and retrieve a single objects.
@@ -25,6 +41,26 @@ class CourseViewSet(viewsets.ReadOnlyModelViewSet):
 
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
+    pagination_class = CourseCursorPagination
+    # the contents are read right after enrolling
+    replica_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        '''
+        prefetch the modules, and their contents
+        with items when the contents are requested
+        '''
+
+        qs = super(CourseViewSet, self).get_queryset()
+        if self.action == 'contents':
+            if self.request.query_params.get('stream'):
+                # the modules are fetched one by one while streaming
+                return qs
+            return qs.prefetch_related(
+                        Prefetch('modules',
+                                queryset=Module.objects.with_contents())
+                        )
+        return qs.prefetch_related('modules')
 
     @detail_route(methods=['post'],
                     authentication_classes=[BasicAuthentication],
@@ -34,19 +70,106 @@ class CourseViewSet(viewsets.ReadOnlyModelViewSet):
         course.users.add(request.user)
         return Response({'enrolled': True})
 
+    @list_route(methods=['post'],
+                url_path='bulk-enroll',
+                parser_classes=[JSONParser, UsersCSVParser],
+                permission_classes=[IsAuthenticated])
+    def bulk_enroll(self, request, *args, **kwargs):
+        '''
+        enrolls a cohort of users, given by their ids or usernames
+        as a JSON list or a CSV file, in the courses given by their
+        ids or slugs in the body or the courses parameter. only the
+        staff can enroll users in the courses of other instructors
+        '''
+
+        data = request.data
+        if isinstance(data, list):
+            data = {'users': data}
+        if not isinstance(data, dict):
+            raise ParseError('an object or a list of users is expected')
+        courses, users = data.get('courses'), data.get('users')
+        if not courses:
+            courses = [parse_argument(course) for course in
+                        request.query_params.get('courses', '').split(',') if course.strip()]
+        if not isinstance(courses, list) or not isinstance(users, list):
+            raise ParseError('lists of courses and users are expected')
+        try:
+            courses = [parse_identifier(course) for course in courses]
+            users = [parse_identifier(user) for user in users]
+        except ValueError as e:
+            raise ParseError(str(e))
+        queryset = Course.objects.all()
+        if not request.user.is_staff:
+            queryset = queryset.filter(owner=request.user)
+        courses, unknown_courses = resolve_courses(courses, queryset)
+        if unknown_courses:
+            raise NotFound('unknown courses: {}'.format(
+                            ', '.join(str(course) for course in unknown_courses)))
+        user_ids, unknown_users = resolve_users(users)
+        enrolled = enroll_users(courses, user_ids)
+        return Response({'enrolled': enrolled,
+                            'users': len(user_ids),
+                            'unknown_users': unknown_users})
+
     @detail_route(methods=['get'],
                     serializer_class=CourseWithContentSerializer,
                     authentication_classes=[BasicAuthentication],
-                    permission_classes=[IsAuthenticated])
+                    permission_classes=[IsAuthenticated, IsEnrolled])
     def contents(self, request, *args, **kwargs):
-        return self.retrieve(request, *args, **kwargs)
+        if request.query_params.get('stream'):
+            # send the modules by chunks as soon as they are rendered
+            course = self.get_object()
+            chunks = iter_course_contents(course, self.get_serializer_context())
+            # before the status is sent, so a failure is still an error
+            first = next(chunks)
+            return StreamingHttpResponse(itertools.chain([first], chunks),
+                                            content_type='application/json')
+        course = self.get_object()
+        # render all the items of the course in one cache round trip
+        render_items(content.item for module in course.modules.all()
+                                    for content in module.contents.all())
+        serializer = self.get_serializer(course)
+        return Response(serializer.data)
 
 
-class SubjectListView(generics.ListAPIView):
+class SubjectListView(InstrumentedAPIMixin, ReplicaReadAPIMixin, generics.ListAPIView):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
+    pagination_class = SubjectCursorPagination
 
 
-class SubjectDetailView(generics.RetrieveAPIView):
+class SubjectDetailView(InstrumentedAPIMixin, generics.RetrieveAPIView):
     queryset = Subject.objects.all()
     serializer_class = SubjectSerializer
+
+
+class SearchView(InstrumentedAPIMixin, APIView):
+    '''
+    courses best matching the words of the q parameter,
+    best first. the matching modules and texts only rank
+    their course, their titles are not shown to anyone
+    '''
+
+    permission_classes = [AllowAny]
+
+    def get(self, request, format=None):
+        course_ids = search_courses(request.query_params.get('q', ''))
+        courses = Course.objects.filter(id__in=course_ids).values('id', 'title', 'slug')
+        return Response({'results': sorted(courses,
+                                            key=lambda course: course_ids.index(course['id']))})
+
+
+class InstrumentationView(APIView):
+    '''
+    the queries, cache usage and timings of each view
+    since the start of the process, reset by DELETE
+    '''
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, format=None):
+        return Response({'views': get_aggregates()})
+
+    def delete(self, request, format=None):
+        reset_aggregates()
+        return Response(status=204)
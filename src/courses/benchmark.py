@@ -0,0 +1,386 @@
+'''
+synthetic catalogues at a configurable scale and timings
+of the main pages and API endpoints against them. each page
+is requested with empty caches, then again once they are warm,
+recording the wall time and the number of SQL queries.
+the throughput of the reads under concurrent writes and
+the rendering of large modules are measured as well
+'''
+
+import base64
+import random
+import statistics
+import threading
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, models, transaction, OperationalError
+from django.template import engines
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .counters import count_students
+from .models import Course, Module, Content
+from .cache import render_items
+from .transfer import CourseImporter
+
+
+ITEM_KINDS = ('text', 'file', 'image', 'video')
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+         'tempor incididunt ut labore et dolore magna aliqua python django module '
+         'course lesson variable function class query cache index').split()
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def synthetic_records(rng, subjects, courses, modules, contents, owners, prefix):
+    '''
+    the records of a generated catalogue, in the
+    format read by the importer of the course trees
+    '''
+
+    for subject in range(subjects):
+        yield {'model': 'subject', 'id': subject,
+                'title': '{} {}'.format(sentence(rng, 2), subject),
+                'slug': '{}-subject-{}'.format(prefix, subject)}
+    module_id = content_id = 0
+    for course in range(courses):
+        yield {'model': 'course', 'id': course,
+                'subject': course % subjects,
+                'owner': rng.choice(owners),
+                'title': sentence(rng, 4),
+                'slug': '{}-course-{}'.format(prefix, course),
+                'overview': sentence(rng, 40)}
+        for module in range(modules):
+            module_id += 1
+            yield {'model': 'module', 'id': module_id, 'course': course,
+                    'title': sentence(rng, 3), 'description': sentence(rng, 20),
+                    'order': module}
+            for order in range(contents):
+                content_id += 1
+                kind = ITEM_KINDS[content_id % len(ITEM_KINDS)]
+                item = {'model': kind, 'id': content_id,
+                        'owner': rng.choice(owners), 'title': sentence(rng, 3)}
+                if kind == 'text':
+                    item['content'] = sentence(rng, 120)
+                elif kind == 'video':
+                    item['url'] = 'https://www.youtube.com/watch?v={:011d}'.format(content_id)
+                else:
+                    # the names of missing blobs, the files are never read
+                    item['file'] = '{}s/{:064x}.{}'.format(
+                                    kind, content_id, 'jpg' if kind == 'image' else 'pdf')
+                yield item
+                yield {'model': 'content', 'id': content_id, 'module': module_id,
+                        'item_model': kind, 'item': content_id, 'order': order}
+
+
+def create_users(usernames, password):
+    '''
+    creates the missing users, all sharing the same password
+    '''
+
+    existing = set(User.objects.filter(username__in=usernames)
+                                .values_list('username', flat=True))
+    # hashing is slow, the hash is computed once
+    password = make_password(password)
+    User.objects.bulk_create([User(username=username, password=password)
+                                for username in usernames if username not in existing])
+    return dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+
+def generate_catalogue(subjects=10, courses=100, modules=10, contents=10,
+                        instructors=10, students=100, enrollments=5,
+                        password='bench', prefix='bench', seed=0, batch_size=5000):
+    '''
+    creates a synthetic catalogue, its instructors and its
+    students, each enrolled in a few random courses. returns
+    the number of courses created
+    '''
+
+    rng = random.Random(seed)
+    owners = list(create_users(['{}_instructor_{}'.format(prefix, n)
+                                for n in range(instructors)], password))
+    importer = CourseImporter(batch_size)
+    for record in synthetic_records(rng, subjects, courses, modules, contents, owners, prefix):
+        importer.add(record)
+    importer.flush()
+
+    student_ids = create_users(['{}_student_{}'.format(prefix, n)
+                                for n in range(students)], password).values()
+    course_ids = list(Course.objects.filter(slug__startswith='{}-course-'.format(prefix))
+                                    .values_list('id', flat=True))
+    Enrollment = Course.users.through
+    existing = set(Enrollment.objects.filter(course_id__in=course_ids)
+                                        .values_list('course_id', 'user_id'))
+    enrolled = {(course_id, user_id) for user_id in student_ids
+                for course_id in rng.sample(course_ids, min(enrollments, len(course_ids)))}
+    Enrollment.objects.bulk_create([Enrollment(course_id=course_id, user_id=user_id)
+                                    for course_id, user_id in enrolled - existing],
+                                    batch_size=batch_size)
+    count_students(course_ids)
+    cache.clear()
+    return importer.imported
+
+
+def measure(client, url, **headers):
+    '''
+    requests the page and returns the wall time in milliseconds,
+    the number of queries and the queries repeated within it
+    '''
+
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = client.get(url, **headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        else:
+            response.content
+        elapsed = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        raise ValueError('{} answered {}'.format(url, response.status_code))
+    return elapsed, len(queries), len(response.instrumentation['duplicates'])
+
+
+def get_targets(password):
+    '''
+    the (name, url, user, headers) of the benchmarked requests,
+    on the course with the most contents and its first module
+    '''
+
+    course = Course.objects.select_related('owner').order_by('-content_count', 'id').first()
+    if course is None:
+        raise ValueError('no course to benchmark, generate a catalogue first')
+    module = course.modules.first()
+    student = course.users.order_by('id').first()
+    targets = [('course_list', reverse('course-list'), None, {}),
+                ('course_list_subject', reverse('course-list-subject',
+                                                args=[course.subject.slug]), None, {}),
+                ('course_detail', reverse('course-detail', args=[course.slug]), None, {}),
+                ('api_courses', reverse('api:course-list'), None, {})]
+    if module is not None:
+        targets.append(('module_content_list',
+                        reverse('module-content-list', args=[module.id]), course.owner, {}))
+    if student is not None:
+        credentials = base64.b64encode('{}:{}'.format(student.username, password).encode())
+        authorization = {'HTTP_AUTHORIZATION': 'Basic ' + credentials.decode()}
+        targets += [('user_course_detail',
+                        reverse('user-course-detail', args=[course.id]), student, {}),
+                    ('api_course_contents',
+                        reverse('api:course-contents', args=[course.id]), None, authorization),
+                    ('api_course_contents_stream',
+                        reverse('api:course-contents', args=[course.id]) + '?stream=1',
+                        None, authorization)]
+    return targets
+
+
+def run_benchmarks(repeat=5, password='bench', host='localhost', names=None):
+    '''
+    times each request with cold caches then repeat times
+    with warm caches, and returns the results as a dict
+    '''
+
+    results = []
+    for name, url, user, headers in get_targets(password):
+        if names and name not in names:
+            continue
+        # the middleware of the client reports the repeated queries
+        with override_settings(REQUEST_INSTRUMENTATION=True):
+            client = Client(HTTP_HOST=host)
+            if user is not None:
+                client.force_login(user)
+            cache.clear()
+            cold_time, cold_queries, cold_duplicates = measure(client, url, **headers)
+            warm = [measure(client, url, **headers) for _ in range(repeat)]
+        results.append({'name': name,
+                        'url': url,
+                        'cold': {'time_ms': round(cold_time, 2),
+                                    'queries': cold_queries,
+                                    'duplicates': cold_duplicates},
+                        'warm': {'median_ms': round(statistics.median(t for t, q, d in warm), 2),
+                                    'min_ms': round(min(t for t, q, d in warm), 2),
+                                    'queries': max(q for t, q, d in warm),
+                                    'duplicates': max(d for t, q, d in warm)}})
+    return {'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'scale': {'courses': Course.objects.count(),
+                        'modules': Course.objects.aggregate(
+                                        total=models.Sum('module_count'))['total'] or 0,
+                        'contents': Course.objects.aggregate(
+                                        total=models.Sum('content_count'))['total'] or 0,
+                        'users': User.objects.count()},
+            'results': results}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_concurrency_benchmark(readers=4, writers=1, seconds=5, journal_mode=None):
+    '''
+    reads the catalogue and module contents from several threads
+    while others enroll and unenroll students, and returns the
+    throughput and latency of the reads. the journal mode of the
+    database may be changed first, e.g. to compare it with WAL
+    '''
+
+    if journal_mode:
+        connection.close()
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode = {}'.format(journal_mode))
+        # every new connection must use it as well
+        connection.settings_dict['OPTIONS'].setdefault('pragmas', {})['journal_mode'] = journal_mode
+        connection.close()
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        actual_mode = cursor.fetchone()[0]
+    course_ids = list(Course.objects.values_list('id', flat=True))
+    module_ids = list(Module.objects.values_list('id', flat=True))
+    user_ids = list(User.objects.values_list('id', flat=True)[:100])
+    if not course_ids or not module_ids or not user_ids:
+        raise ValueError('no course to benchmark, generate a catalogue first')
+    connection.close()
+
+    deadline = time.perf_counter() + seconds
+    latencies, writes, errors = [], [], []
+
+    def read():
+        rng = random.Random()
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    list(Course.objects.values('id', 'title', 'slug', 'module_count')[:20])
+                    list(Content.objects.filter(module_id=rng.choice(module_ids)).with_items())
+                except OperationalError as e:
+                    errors.append(str(e))
+                    continue
+                latencies.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+
+    def write():
+        rng = random.Random()
+        try:
+            while time.perf_counter() < deadline:
+                course = Course(id=rng.choice(course_ids))
+                user_id = rng.choice(user_ids)
+                try:
+                    with transaction.atomic():
+                        course.users.add(user_id)
+                    with transaction.atomic():
+                        course.users.remove(user_id)
+                except OperationalError as e:
+                    errors.append(str(e))
+                    continue
+                writes.append(2)
+        finally:
+            connection.close()
+
+    threads = ([threading.Thread(target=read) for _ in range(readers)] +
+                [threading.Thread(target=write) for _ in range(writers)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {'journal_mode': actual_mode,
+            'readers': readers,
+            'writers': writers,
+            'seconds': seconds,
+            'reads_per_second': round(len(latencies) / seconds, 1),
+            'writes_per_second': round(sum(writes) / seconds, 1),
+            'read_p50_ms': round((percentile(latencies, 0.5) or 0) * 1000, 2),
+            'read_p95_ms': round((percentile(latencies, 0.95) or 0) * 1000, 2),
+            'read_max_ms': round(max(latencies or [0]) * 1000, 2),
+            'errors': len(errors)}
+
+
+# the module pages as they were before the render_module_contents tag
+LEGACY_MODULE_TEMPLATES = {
+    'student': '''
+    {% for content in module.contents.all %}
+      {% with item=content.item %}
+      <h2>{{ item.title }} </h2>
+      {{ item.render }}
+      {% endwith %}
+    {% endfor %}''',
+    'editable': '''{% load course %}
+        {% for content in module.contents.all %}
+          <div data-id="{{ content.id }}">
+            {% with item=content.item %}
+              <p>{{ item }} ({{ item|model_name }}) </p>
+              <a href="{% url 'module-content-update' module.id item|model_name item.id %}"> Edit </a>
+              <form action="{% url "module-content-delete" content.id %}" method="post"><input type="submit" value="Delete">
+                {% csrf_token %}
+              </form>
+            {% endwith %}
+          </div>
+          {% empty %}
+          <p> This module has no contents yet. </p>
+        {% endfor %}''',
+}
+
+MODULE_TEMPLATES = {
+    'student': '{% load course %}{% render_module_contents module %}',
+    'editable': '{% load course %}{% render_module_contents module editable=True %}',
+}
+
+
+def render_module(module_id, source, page):
+    '''
+    loads the module and renders its contents like the
+    page does, returning the wall time in milliseconds
+    '''
+
+    start = time.perf_counter()
+    module = Module.objects.with_contents().get(id=module_id)
+    if source is LEGACY_MODULE_TEMPLATES and page == 'student':
+        # the view rendered the items in one cache round trip
+        render_items(content.item for content in module.contents.all())
+    template = engines['django'].from_string(source[page])
+    template.render({'module': module, 'csrf_token': 'benchmark'})
+    return (time.perf_counter() - start) * 1000
+
+
+def run_render_benchmark(contents=500, repeat=5):
+    '''
+    times the rendering of the contents of a module by the
+    render_module_contents tag and by the previous templates,
+    with cold then warm caches. the module is created in a
+    transaction rolled back at the end
+    '''
+
+    results = []
+    with transaction.atomic():
+        owners = list(create_users(['render_bench_instructor'], 'bench'))
+        importer = CourseImporter(contents)
+        for record in synthetic_records(random.Random(0), 1, 1, 1, contents,
+                                            owners, 'render-bench'):
+            importer.add(record)
+        importer.flush()
+        module_id = Module.objects.get(course__slug='render-bench-course-0').id
+        for page in ('student', 'editable'):
+            for name, source in (('template', LEGACY_MODULE_TEMPLATES),
+                                    ('tag', MODULE_TEMPLATES)):
+                cache.clear()
+                cold = render_module(module_id, source, page)
+                warm = [render_module(module_id, source, page) for _ in range(repeat)]
+                results.append({'page': page,
+                                'renderer': name,
+                                'cold_ms': round(cold, 2),
+                                'warm_median_ms': round(statistics.median(warm), 2),
+                                'warm_min_ms': round(min(warm), 2)})
+        transaction.set_rollback(True)
+    cache.clear()
+    return {'created': timezone.now().isoformat(),
+            'contents': contents,
+            'results': results}
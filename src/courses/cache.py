@@ -0,0 +1,388 @@
+'''
+caching helpers for the courses application.
+rendered items are cached under a key built from
+their model, primary key and last update, so editing
+an item automatically invalidates its cached output.
+catalogue data and course page fragments are cached under
+keys versioned by generation counters bumped on every change.
+hot values are recomputed by a single worker at a time, the
+others serving the stale value meanwhile, and so are the pages
+of the per-site cache
+'''
+
+import hashlib
+import math
+import random
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.middleware import cache as cache_middleware
+from django.utils.cache import get_max_age
+from django.utils.safestring import mark_safe
+
+from .instrumentation import record_cache
+from .routers import read_from_primary
+
+
+RENDER_CACHE_TIMEOUT = getattr(settings, 'ITEM_RENDER_CACHE_TIMEOUT', 60 * 60 * 24)
+
+# hits and misses of the render cache for the current process
+render_stats = Counter()
+
+
+def render_key(item):
+    '''
+    cache key of the rendered output of an item
+    '''
+
+    return 'item_render_{}_{}_{:%Y%m%d%H%M%S%f}'.format(item._meta.model_name,
+                                                        item.pk,
+                                                        item.updated)
+
+
+def render_items(items):
+    '''
+    returns the rendered output of the given items,
+    fetching all of them in one cache round trip and
+    rendering only those missing from the cache
+    '''
+
+    items = list(items)
+    keys = [render_key(item) if item.pk else None for item in items]
+    rendered = cache.get_many([key for key in keys if key])
+    render_stats['hits'] += len(rendered)
+    record_cache('render', hits=len(rendered))
+    missing, templates = {}, {}
+    for key, item in zip(keys, items):
+        if key is None:
+            # unsaved items are never cached
+            continue
+        if key not in rendered and key not in missing:
+            # each template is looked up once per type
+            model = type(item)
+            if model not in templates:
+                templates[model] = model.get_template()
+            missing[key] = item.render_template(templates[model])
+    if missing:
+        render_stats['misses'] += len(missing)
+        record_cache('render', misses=len(missing))
+        cache.set_many(missing, RENDER_CACHE_TIMEOUT)
+        rendered.update(missing)
+    output = []
+    for key, item in zip(keys, items):
+        html = rendered[key] if key else item.render_template()
+        item._rendered = (key, html)
+        output.append(mark_safe(html))
+    return output
+
+
+CATALOGUE_CACHE_TIMEOUT = getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 60 * 60 * 24)
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24)
+
+# how long an expired value may still be served while it is recomputed
+STALE_SECONDS = getattr(settings, 'CACHE_STALE_SECONDS', 60)
+# after which a worker that died while recomputing a value is replaced
+LOCK_SECONDS = getattr(settings, 'CACHE_LOCK_SECONDS', 10)
+# how long a worker waits for a missing value computed by another
+LOCK_WAIT = getattr(settings, 'CACHE_LOCK_WAIT', 0.5)
+LOCK_POLL = 0.05
+# the higher, the earlier the values are recomputed before they expire
+EARLY_EXPIRATION_BETA = getattr(settings, 'CACHE_EARLY_EXPIRATION_BETA', 1.0)
+
+# lock contention and stale values served by the current process
+stampede_stats = Counter()
+
+
+def record_stampede(name, event):
+    stampede_stats['{}_{}'.format(name, event)] += 1
+    record_cache(name, **{event: 1})
+
+
+def lock_key(key):
+    return 'lock_{}'.format(key)
+
+
+def acquire_lock(lock, backend=None):
+    '''
+    whether the caller may compute the value: either it took
+    the lock, or the lock could not be taken although nobody
+    holds it, e.g. when the cache is unreachable
+    '''
+
+    if backend is None:
+        backend = cache
+    return backend.add(lock, 1, LOCK_SECONDS) or backend.get(lock) is None
+
+
+def expires_early(expires, delta):
+    '''
+    whether to recompute a value before it expires, with a
+    probability growing as the expiry approaches, sooner for
+    the values slow to compute (the XFetch algorithm)
+    '''
+
+    return time.time() - delta * EARLY_EXPIRATION_BETA * math.log(1 - random.random()) >= expires
+
+
+def compute_entry(key, compute, timeout, version):
+    '''
+    computes the value from the primary database and caches it
+    along with its version, its expiry and the time it took, then
+    lets the others recompute it
+    '''
+
+    try:
+        start = time.perf_counter()
+        with read_from_primary():
+            value = compute()
+        delta = time.perf_counter() - start
+        # kept past its expiry so it can be served while recomputed
+        cache.set(key, (value, version, time.time() + timeout, delta), timeout + STALE_SECONDS)
+    finally:
+        cache.delete(lock_key(key))
+    return value
+
+
+def get_or_compute(key, compute, timeout, version=None, name='cache'):
+    '''
+    returns the cached value of the key, or computes it. a single
+    worker recomputes an expired value, or one of an outdated
+    version, while the others are served the stale value. a
+    missing value is awaited for a moment rather than computed
+    by every worker at once
+    '''
+
+    entry = cache.get(key)
+    if entry is not None and entry[1] != version and hasattr(cache, 'get_shared'):
+        # the copy kept by the process may predate the value
+        # another process already computed for this version
+        entry = cache.get_shared(key, entry)
+    if entry is not None:
+        value, entry_version, expires, delta = entry
+        if entry_version == version and not expires_early(expires, delta):
+            record_cache(name, hits=1)
+            return value
+        if not acquire_lock(lock_key(key)):
+            # another worker is recomputing it
+            record_cache(name, hits=1)
+            record_stampede(name, 'stale')
+            return value
+        record_cache(name, misses=1)
+        if entry_version == version and time.time() < expires:
+            record_stampede(name, 'early')
+        return compute_entry(key, compute, timeout, version)
+
+    record_cache(name, misses=1)
+    if not acquire_lock(lock_key(key)):
+        record_stampede(name, 'contended')
+        deadline = time.perf_counter() + LOCK_WAIT
+        while time.perf_counter() < deadline:
+            time.sleep(LOCK_POLL)
+            entry = cache.get(key)
+            if entry is not None and entry[1] == version:
+                return entry[0]
+        # the other worker is too slow, computes it as well
+        record_stampede(name, 'wait_timeout')
+        with read_from_primary():
+            return compute()
+    return compute_entry(key, compute, timeout, version)
+
+
+def generation_key(name):
+    return 'generation_{}'.format(name)
+
+
+def get_generations(*names):
+    '''
+    returns the current generation of each given name.
+    cached data is stored under keys that include these
+    generations, so bumping one makes its old keys unreachable
+    '''
+
+    keys = [generation_key(name) for name in names]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # start from the current time so a counter evicted
+            # from the cache never goes back to an old value
+            cache.add(key, int(time.time() * 1000), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generation(*names):
+    '''
+    invalidates all the data cached for the given names
+    '''
+
+    for name in names:
+        key = generation_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # the counter is not in the cache
+            cache.set(key, int(time.time() * 1000), None)
+
+
+def bump_course_pages(course_ids=(), module_ids=()):
+    '''
+    invalidates the cached module navigation of the given
+    courses and the cached contents of the given modules
+    '''
+
+    names = ['course_{}'.format(course_id) for course_id in set(course_ids)]
+    names += ['module_{}'.format(module_id) for module_id in set(module_ids)]
+    if names:
+        transaction.on_commit(lambda: bump_generation(*names))
+
+
+ENROLLMENT_CACHE_TIMEOUT = getattr(settings, 'ENROLLMENT_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def enrollment_key(user_id):
+    return 'user_{}_enrolled_courses'.format(user_id)
+
+
+def enrollment_generation(user_id):
+    return 'user_{}_enrollments'.format(user_id)
+
+
+def get_enrolled_course_ids(user):
+    '''
+    returns the set of ids of the courses the user
+    is enrolled in, kept in the cache until the
+    enrollments of the user change
+    '''
+
+    if not user.is_authenticated:
+        return frozenset()
+    ids = getattr(user, '_enrolled_course_ids', None)
+    if ids is None:
+        key = enrollment_key(user.id)
+        # read before the enrollments, so a set read while they change
+        # is stored under the generation they bump and never served
+        generation, = get_generations(enrollment_generation(user.id))
+        entry = cache.get(key)
+        if entry is not None and entry[0] == generation:
+            ids = entry[1]
+        else:
+            through = user.courses_joined.through
+            with read_from_primary():
+                ids = frozenset(through.objects.filter(user_id=user.id)
+                                                .values_list('course_id', flat=True))
+            cache.set(key, (generation, ids), ENROLLMENT_CACHE_TIMEOUT)
+        # remember them for the rest of the request
+        user._enrolled_course_ids = ids
+    return ids
+
+
+def forget_enrollments(user_ids):
+    '''
+    invalidates the enrolled courses of the given users
+    '''
+
+    bump_generation(*[enrollment_generation(user_id) for user_id in user_ids])
+
+
+class StaleCache(object):
+    '''
+    stores the values STALE_SECONDS longer than asked,
+    so they can be served while they are recomputed
+    '''
+
+    def __init__(self, cache):
+        self._cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._cache, name)
+
+    def set(self, key, value, timeout=None, version=None):
+        if timeout is not None:
+            timeout += STALE_SECONDS
+        self._cache.set(key, value, timeout, version=version)
+
+
+def page_lock_key(request):
+    url = request.build_absolute_uri().encode('utf-8')
+    return lock_key('page_{}'.format(hashlib.md5(url).hexdigest()))
+
+
+class UpdateCacheMiddleware(cache_middleware.UpdateCacheMiddleware):
+    '''
+    stores the pages with the time they expire and the
+    time they took to render, and lets the next worker
+    render a page once the current one stored it
+    '''
+
+    def __init__(self, get_response=None):
+        super(UpdateCacheMiddleware, self).__init__(get_response)
+        self.cache = StaleCache(self.cache)
+
+    def process_response(self, request, response):
+        if self._should_update_cache(request, response):
+            timeout = get_max_age(response)
+            if timeout is None:
+                timeout = self.cache_timeout
+            response._cache_expires = time.time() + timeout
+            response._cache_delta = time.perf_counter() - getattr(
+                                        request, '_cache_start', time.perf_counter())
+        response = super(UpdateCacheMiddleware, self).process_response(request, response)
+        if getattr(request, '_cache_lock', None):
+            # after the page was stored, once rendered
+            key = request._cache_lock
+            if hasattr(response, 'add_post_render_callback'):
+                response.add_post_render_callback(lambda r: self.cache.delete(key))
+            else:
+                self.cache.delete(key)
+        return response
+
+
+class FetchFromCacheMiddleware(cache_middleware.FetchFromCacheMiddleware):
+    '''
+    a single worker renders an expired page while the others
+    are served the stale one, and pages about to expire are
+    rendered again early. a missing page is awaited for a
+    moment rather than rendered by every worker at once
+    '''
+
+    def process_request(self, request):
+        request._cache_start = time.perf_counter()
+        response = super(FetchFromCacheMiddleware, self).process_request(request)
+        if response is not None:
+            expires = getattr(response, '_cache_expires', None)
+            if expires is None or not expires_early(expires, response._cache_delta):
+                record_cache('page', hits=1)
+                return response
+            request._cache_lock = page_lock_key(request)
+            if not acquire_lock(request._cache_lock, self.cache):
+                request._cache_lock = None
+                record_cache('page', hits=1)
+                if time.time() >= expires:
+                    record_stampede('page', 'stale')
+                return response
+            if time.time() < expires:
+                record_stampede('page', 'early')
+            record_cache('page', misses=1)
+            request._cache_update_cache = True
+            return None
+
+        if not getattr(request, '_cache_update_cache', False):
+            return None
+        record_cache('page', misses=1)
+        request._cache_lock = page_lock_key(request)
+        if acquire_lock(request._cache_lock, self.cache):
+            return None
+        request._cache_lock = None
+        record_stampede('page', 'contended')
+        deadline = time.perf_counter() + LOCK_WAIT
+        while time.perf_counter() < deadline:
+            time.sleep(LOCK_POLL)
+            response = super(FetchFromCacheMiddleware, self).process_request(request)
+            if response is not None:
+                return response
+        record_stampede('page', 'wait_timeout')
+        request._cache_update_cache = True
+        return None
@@ -0,0 +1,104 @@
+'''
+denormalized counters of the catalogue. they are updated
+in place with F() expressions when objects are created,
+deleted or enrolled, and can be repaired in batches
+when they drift, e.g. after bulk inserts
+'''
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Subject, Course, Module, Content
+
+
+def change_count(model, ids, field, delta):
+    '''
+    atomically adds delta to the counter of the given objects,
+    never letting a drifted counter go below zero
+    '''
+
+    qs = model.objects.filter(id__in=ids)
+    if delta < 0:
+        qs = qs.filter(**{'{}__gte'.format(field): -delta})
+    qs.update(**{field: F(field) + delta})
+
+
+def count_students(course_ids):
+    '''
+    recounts the students of the given courses
+    '''
+
+    counts = dict(Course.users.through.objects.filter(course_id__in=course_ids)
+                                                .values_list('course_id')
+                                                .annotate(total=Count('id')))
+    for course_id in course_ids:
+        Course.objects.filter(id=course_id).update(
+                                student_count=counts.get(course_id, 0))
+
+
+def iter_batches(model, batch_size):
+    '''
+    yields the ids of all the objects by batches,
+    walking the primary key index
+    '''
+
+    last_id = 0
+    while True:
+        ids = list(model.objects.filter(id__gt=last_id).order_by('id')
+                                .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def repair(model, ids, fields, counts):
+    '''
+    writes the actual counts of the objects whose
+    stored counters differ and returns how many were fixed
+    '''
+
+    repaired = 0
+    for row in model.objects.filter(id__in=ids).values('id', *fields):
+        actual = {field: counts[field].get(row['id'], 0) for field in fields}
+        if any(row[field] != actual[field] for field in fields):
+            model.objects.filter(id=row['id']).update(**actual)
+            repaired += 1
+    return repaired
+
+
+def reconcile_counters(batch_size=1000):
+    '''
+    recomputes every counter by batches of objects and
+    returns the number of subjects and courses repaired
+    '''
+
+    repaired = 0
+    for ids in iter_batches(Subject, batch_size):
+        with transaction.atomic():
+            counts = {'course_count': dict(
+                        Course.objects.filter(subject_id__in=ids)
+                                        .order_by()
+                                        .values_list('subject_id')
+                                        .annotate(total=Count('id')))}
+            repaired += repair(Subject, ids, ['course_count'], counts)
+    for ids in iter_batches(Course, batch_size):
+        with transaction.atomic():
+            counts = {
+                'module_count': dict(
+                    Module.objects.filter(course_id__in=ids)
+                                    .order_by()
+                                    .values_list('course_id')
+                                    .annotate(total=Count('id'))),
+                'content_count': dict(
+                    Content.objects.filter(module__course_id__in=ids)
+                                    .order_by()
+                                    .values_list('module__course_id')
+                                    .annotate(total=Count('id'))),
+                'student_count': dict(
+                    Course.users.through.objects.filter(course_id__in=ids)
+                                                .values_list('course_id')
+                                                .annotate(total=Count('id'))),
+            }
+            repaired += repair(Course, ids, list(counts), counts)
+    return repaired
@@ -0,0 +1,168 @@
+'''
+bulk enrollment of whole cohorts of students. the users are
+resolved by batches, and the enrollments of each batch are
+inserted by a single statement ignoring those already existing.
+the receivers of m2m_changed are sent one signal per course,
+as if all its students had been added at once
+'''
+
+import csv
+import json
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models.signals import m2m_changed
+
+from .models import Course
+
+
+Enrollment = Course.users.through
+
+
+def parse_identifier(value):
+    '''
+    JSON integers are ids and strings usernames or slugs,
+    even when made of digits
+    '''
+
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return value.strip()
+    raise ValueError('{} is neither an id nor a name'.format(json.dumps(value)))
+
+
+def parse_argument(value):
+    '''
+    the arguments of the command line and the query strings
+    are text: digits are ids, anything else a slug
+    '''
+
+    value = value.strip()
+    return int(value) if value.isdigit() else value
+
+
+def read_users(stream, format='csv'):
+    '''
+    the users listed by a JSON list, or by the id or username
+    column of a CSV file with a header
+    '''
+
+    if format == 'json':
+        users = json.load(stream)
+        if isinstance(users, dict):
+            users = users.get('users', [])
+        if not isinstance(users, list):
+            raise ValueError('a list of users is expected')
+        return [parse_identifier(user) for user in users]
+    users = []
+    for row in csv.DictReader(stream):
+        if row.get('id'):
+            users.append(int(row['id']))
+        elif row.get('username'):
+            users.append(row['username'].strip())
+        else:
+            raise ValueError('each row needs an id or a username')
+    return users
+
+
+def split_identifiers(identifiers):
+    ids, names = [], []
+    for identifier in identifiers:
+        (ids if isinstance(identifier, int) else names).append(identifier)
+    return ids, names
+
+
+def batches(values, batch_size):
+    values = list(values)
+    for start in range(0, len(values), batch_size):
+        yield values[start:start + batch_size]
+
+
+def resolve_users(identifiers, batch_size=1000):
+    '''
+    returns the ids of the given users and the
+    identifiers matching none, querying by batches
+    '''
+
+    ids, usernames = split_identifiers(identifiers)
+    user_ids, found_ids, found_names = set(), set(), set()
+    for batch in batches(set(ids), batch_size):
+        found_ids.update(User.objects.filter(id__in=batch).values_list('id', flat=True))
+    for batch in batches(set(usernames), batch_size):
+        for user_id, username in User.objects.filter(username__in=batch).values_list(
+                                                                'id', 'username'):
+            user_ids.add(user_id)
+            found_names.add(username)
+    user_ids |= found_ids
+    unknown = [identifier for identifier in identifiers
+                if identifier not in found_ids and identifier not in found_names]
+    return user_ids, unknown
+
+
+def resolve_courses(identifiers, queryset=None):
+    '''
+    returns the courses of the given ids or slugs and the
+    identifiers matching none, out of the queryset if given
+    '''
+
+    if queryset is None:
+        queryset = Course.objects.all()
+    ids, slugs = split_identifiers(identifiers)
+    courses = list(queryset.filter(id__in=ids)) + list(queryset.filter(slug__in=slugs))
+    found = {course.id for course in courses} | {course.slug for course in courses}
+    unique = {course.id: course for course in courses}
+    return (sorted(unique.values(), key=lambda course: course.id),
+            [identifier for identifier in identifiers if identifier not in found])
+
+
+def insert_ignore(rows):
+    '''
+    inserts the (course id, user id) rows in a single
+    statement, skipping the existing enrollments
+    '''
+
+    table = connection.ops.quote_name(Enrollment._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(Enrollment._meta.get_field(name).column)
+                        for name in ('course', 'user'))
+    values = ', '.join(['(%s, %s)'] * len(rows))
+    if connection.vendor == 'sqlite':
+        sql = 'INSERT OR IGNORE INTO {} ({}) VALUES {}'
+    elif connection.vendor == 'mysql':
+        sql = 'INSERT IGNORE INTO {} ({}) VALUES {}'
+    else:
+        sql = 'INSERT INTO {} ({}) VALUES {} ON CONFLICT DO NOTHING'
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(table, columns, values),
+                        [value for row in rows for value in row])
+
+
+def enroll_users(courses, user_ids, batch_size=1000):
+    '''
+    enrolls the users in each course, and returns the number
+    of users newly enrolled in each. the enrollments of a course
+    are added in one transaction, notified by a single signal
+    '''
+
+    # the statements are limited in number of parameters
+    batch_size = min(batch_size, connection.ops.bulk_batch_size(['course', 'user'],
+                                                                    list(user_ids)) or batch_size)
+    enrolled = {}
+    for course in courses:
+        with transaction.atomic():
+            added = set()
+            for batch in batches(sorted(user_ids), batch_size):
+                existing = set(Enrollment.objects.filter(course_id=course.id, user_id__in=batch)
+                                                    .values_list('user_id', flat=True))
+                added.update(user_id for user_id in batch if user_id not in existing)
+            if added:
+                m2m_changed.send(sender=Enrollment, action='pre_add', instance=course,
+                                    reverse=False, model=User, pk_set=added,
+                                    using=connection.alias)
+                for batch in batches(sorted(added), batch_size):
+                    insert_ignore([(course.id, user_id) for user_id in batch])
+                m2m_changed.send(sender=Enrollment, action='post_add', instance=course,
+                                    reverse=False, model=User, pk_set=added,
+                                    using=connection.alias)
+        enrolled[course.id] = len(added)
+    return enrolled
@@ -1,5 +1,5 @@
-from django.db import models
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections, models, router, transaction
+from django.db.models import Max, Q
 
 
 class OrderField(models.PositiveIntegerField):
@@ -18,20 +18,82 @@ class OrderField(models.PositiveIntegerField):
 
         if getattr(model_instance, self.attname) is None:
             # no current value for the field
-            try:
-                qs = self.model.objects.all()
-                if self.for_fields:
-                    # filter by objects with the same field values
-                    # for the fields in 'for_fields'
-                    query = {field: getattr(model_instance, field) for field in self.for_fields}
-                    qs = qs.filter(**query)
-                # get the order of the last item
-                last_item = qs.latest(self.attname)
-                value = last_item.order + 1
-            except ObjectDoesNotExist:
-                value = 0
-            setattr(model_instance, self.attname, value)
-            return value
+            self.allocate([model_instance])
+            return getattr(model_instance, self.attname)
         else:
             # has a current value for the field
             return super(OrderField, self).pre_save(model_instance, add)
+
+    def get_group(self, model_instance):
+        '''
+        values of the fields in 'for_fields' for the given instance
+        '''
+
+        attnames = [self.model._meta.get_field(field).attname
+                    for field in self.for_fields or []]
+        return tuple((attname, getattr(model_instance, attname))
+                        for attname in attnames)
+
+    def allocate(self, instances):
+        '''
+        gives consecutive orders to the instances that have none,
+        following the last order of the objects with the same
+        values for the fields in 'for_fields'. the rows of the
+        parent objects are locked until the end of the transaction
+        so concurrent allocations for the same parent are serialized,
+        and the last orders of all groups are read in one query
+        '''
+
+        groups = {}
+        for instance in instances:
+            if getattr(instance, self.attname) is None:
+                groups.setdefault(self.get_group(instance), []).append(instance)
+        if not groups:
+            return
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using, savepoint=False):
+            self.lock_parents(groups, using)
+            last_orders = self.get_last_orders(groups, using)
+            for group, members in groups.items():
+                last = last_orders.get(group)
+                value = 0 if last is None else last + 1
+                for instance in members:
+                    setattr(instance, self.attname, value)
+                    value += 1
+
+    def get_last_orders(self, groups, using):
+        '''
+        returns the last order of each group in a single query
+        '''
+
+        qs = self.model._default_manager.using(using).order_by()
+        if not self.for_fields:
+            return {(): qs.aggregate(last=Max(self.attname))['last']}
+        # filter by objects with the same field values
+        # for the fields in 'for_fields'
+        query = Q()
+        for group in groups:
+            query |= Q(**dict(group))
+        attnames = [attname for attname, value in next(iter(groups))]
+        rows = qs.filter(query).values(*attnames).annotate(last=Max(self.attname))
+        return {tuple((attname, row[attname]) for attname in attnames): row['last']
+                for row in rows}
+
+    def lock_parents(self, groups, using):
+        '''
+        locks the rows of the objects referenced
+        by the foreign keys in 'for_fields'
+        '''
+
+        if not connections[using].features.has_select_for_update:
+            # sqlite locks the whole database for writing instead
+            return
+        for field in self.for_fields or []:
+            field = self.model._meta.get_field(field)
+            if not field.is_relation:
+                continue
+            ids = {dict(group)[field.attname] for group in groups}
+            list(field.related_model._default_manager.using(using)
+                                                    .select_for_update()
+                                                    .filter(pk__in=ids)
+                                                    .values_list('pk', flat=True))
@@ -0,0 +1,100 @@
+'''
+smaller and compressed variants of the uploaded images,
+stored next to the original and offered to the browsers
+through srcset. Pillow is optional: without it the
+original images are served alone
+'''
+
+import os
+import re
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
+from .storage import content_storage
+
+
+DERIVATIVE_WIDTHS = getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (320, 640, 1280))
+DERIVATIVE_QUALITY = getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', 80)
+
+
+def derivative_name(name, width):
+    base, extension = os.path.splitext(name)
+    return '{}_w{}{}'.format(base, width, extension)
+
+
+def original_name(name):
+    '''
+    name of the image a derivative was generated from
+    '''
+
+    return re.sub(r'_w\d+(\.\w+)?$', r'\1', name)
+
+
+def derivative_names(name):
+    return [derivative_name(name, width) for width in DERIVATIVE_WIDTHS]
+
+
+def get_srcset(name, width, derivative_widths):
+    '''
+    srcset attribute listing the derivatives of the image followed
+    by the original, from the widths stored once they are generated
+    '''
+
+    candidates = ['{} {}w'.format(content_storage.url(derivative_name(name, derivative_width)),
+                                    derivative_width)
+                    for derivative_width in parse_widths(derivative_widths)]
+    if candidates and width:
+        candidates.append('{} {}w'.format(content_storage.url(name), width))
+    return ', '.join(candidates)
+
+
+def format_widths(widths):
+    return ','.join(str(width) for width in widths)
+
+
+def parse_widths(value):
+    return [int(width) for width in value.split(',') if width]
+
+
+def generate_derivatives(name):
+    '''
+    stores a resized copy of the image for each width smaller
+    than its own, and returns the width of the image and those
+    of the derivatives. files that are not images have neither
+    '''
+
+    if PILImage is None or not content_storage.exists(name):
+        return None, []
+    try:
+        with content_storage.open(name) as original:
+            image = PILImage.open(original)
+            image.load()
+    except (IOError, SyntaxError):
+        return None, []
+    image_format = image.format
+    widths = []
+    for width in DERIVATIVE_WIDTHS:
+        if width >= image.width:
+            break
+        widths.append(width)
+        target = derivative_name(name, width)
+        if content_storage.exists(target):
+            # the derivatives of a blob never change
+            continue
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), PILImage.LANCZOS)
+        if image_format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+            resized = resized.convert('RGB')
+        output = BytesIO()
+        resized.save(output, format=image_format,
+                        quality=DERIVATIVE_QUALITY, optimize=True)
+        # saved under its exact name, next to the original
+        content_storage.save_as(target, ContentFile(output.getvalue()))
+    return image.width, widths
@@ -0,0 +1,268 @@
+'''
+per-request instrumentation: the SQL queries and their time,
+the query fingerprints repeated within a request, which reveal
+N+1 patterns, the hits and misses of the application caches
+and the time spent rendering the response. each request is
+logged as JSON and aggregated per view for the admin endpoint
+'''
+
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+# maximum number of queries of each view, by URL name
+QUERY_BUDGETS = getattr(settings, 'QUERY_BUDGETS', {})
+
+# times a fingerprint must be repeated to be reported
+DUPLICATE_THRESHOLD = getattr(settings, 'DUPLICATE_QUERY_THRESHOLD', 3)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+_local = threading.local()
+
+_aggregates = {}
+_aggregates_lock = threading.Lock()
+
+
+def fingerprint(sql):
+    '''
+    the statement without its literal values, so the
+    same query run for different objects is recognized
+    '''
+
+    return IN_LISTS.sub('(...)', LITERALS.sub('?', sql))
+
+
+def current_stats():
+    return getattr(_local, 'stats', None)
+
+
+def record_cache(name, hits=0, misses=0, **events):
+    '''
+    counts the cache hits and misses of the current request,
+    and other events such as the stale values served
+    '''
+
+    stats = current_stats()
+    if stats is not None:
+        stats.cache['{}_hits'.format(name)] += hits
+        stats.cache['{}_misses'.format(name)] += misses
+        for event, count in events.items():
+            stats.cache['{}_{}'.format(name, event)] += count
+
+
+def record_time(name, seconds):
+    stats = current_stats()
+    if stats is not None:
+        stats.timings[name] += seconds
+
+
+class RequestStats(object):
+    '''
+    what happened while serving a request
+    '''
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view = None
+        self.action = None
+        self.cache = Counter()
+        self.timings = Counter()
+        self.query_logs = {}
+
+    def start_queries(self):
+        '''
+        logs the queries of every connection, as DEBUG does
+        '''
+
+        for connection in connections.all():
+            self.query_logs[connection.alias] = (connection.force_debug_cursor,
+                                                    len(connection.queries_log))
+            connection.force_debug_cursor = True
+
+    def stop_queries(self):
+        queries = []
+        for connection in connections.all():
+            if connection.alias not in self.query_logs:
+                continue
+            force_debug_cursor, start = self.query_logs[connection.alias]
+            connection.force_debug_cursor = force_debug_cursor
+            queries += list(connection.queries_log)[start:]
+        return queries
+
+    def summary(self, request, response, queries):
+        fingerprints = Counter(fingerprint(query['sql']) for query in queries)
+        budget = QUERY_BUDGETS.get(self.view)
+        summary = {'view': self.view,
+                    'action': self.action,
+                    'method': request.method,
+                    'path': request.path,
+                    'status': response.status_code,
+                    'time_ms': round((time.perf_counter() - self.start) * 1000, 2),
+                    'queries': len(queries),
+                    'query_time_ms': round(sum(float(query['time'])
+                                                for query in queries) * 1000, 2),
+                    'duplicates': {sql: count for sql, count in fingerprints.items()
+                                    if count >= DUPLICATE_THRESHOLD},
+                    'cache': dict(self.cache),
+                    'budget': budget,
+                    'over_budget': budget is not None and len(queries) > budget}
+        summary.update(('{}_ms'.format(name), round(seconds * 1000, 2))
+                        for name, seconds in self.timings.items())
+        if response.streaming:
+            # the queries run while streaming are not counted
+            summary['streaming'] = True
+        return summary
+
+
+def aggregate(summary):
+    '''
+    adds the summary of a request to the totals of its view
+    '''
+
+    with _aggregates_lock:
+        totals = _aggregates.setdefault(summary['view'], {'requests': 0,
+                                                            'time_ms': 0,
+                                                            'queries': 0,
+                                                            'max_queries': 0,
+                                                            'query_time_ms': 0,
+                                                            'over_budget': 0,
+                                                            'cache': Counter(),
+                                                            'duplicates': Counter()})
+        totals['requests'] += 1
+        totals['time_ms'] += summary['time_ms']
+        totals['queries'] += summary['queries']
+        totals['max_queries'] = max(totals['max_queries'], summary['queries'])
+        totals['query_time_ms'] += summary['query_time_ms']
+        totals['over_budget'] += summary['over_budget']
+        totals['cache'].update(summary['cache'])
+        # number of requests repeating each fingerprint
+        totals['duplicates'].update(summary['duplicates'].keys())
+
+
+def get_aggregates():
+    '''
+    the totals and averages of each view, slowest first
+    '''
+
+    with _aggregates_lock:
+        views = [{'view': view,
+                    'requests': totals['requests'],
+                    'avg_time_ms': round(totals['time_ms'] / totals['requests'], 2),
+                    'avg_queries': round(totals['queries'] / totals['requests'], 2),
+                    'max_queries': totals['max_queries'],
+                    'avg_query_time_ms': round(totals['query_time_ms'] / totals['requests'], 2),
+                    'budget': QUERY_BUDGETS.get(view),
+                    'over_budget': totals['over_budget'],
+                    'cache': dict(totals['cache']),
+                    'duplicates': dict(totals['duplicates'].most_common(10))}
+                    for view, totals in _aggregates.items()]
+    return sorted(views, key=lambda view: view['avg_time_ms'], reverse=True)
+
+
+def reset_aggregates():
+    with _aggregates_lock:
+        _aggregates.clear()
+
+
+class InstrumentationMiddleware(object):
+    '''
+    instruments every request, it should be the first
+    middleware so the time of the others is included.
+    enabled by REQUEST_INSTRUMENTATION, when the middleware
+    is loaded, so the tests and benchmarks can turn it on
+    '''
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = _local.stats = RequestStats()
+        stats.start_queries()
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.stats = None
+            queries = stats.stop_queries()
+        summary = stats.summary(request, response, queries)
+        aggregate(summary)
+        if summary['over_budget']:
+            logger.warning(json.dumps(summary))
+        else:
+            logger.info(json.dumps(summary))
+        response.instrumentation = summary
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = current_stats()
+        if stats is not None:
+            stats.view = request.resolver_match.view_name
+
+    def process_template_response(self, request, response):
+        '''
+        called right before the response is rendered
+        '''
+
+        start = time.perf_counter()
+        response.add_post_render_callback(
+                    lambda response: record_time('render', time.perf_counter() - start))
+        return response
+
+
+class InstrumentedAPIMixin(object):
+    '''
+    records the action of the API views, the time spent in
+    authentication, permission and throttling checks, and
+    the time spent in the handler itself
+    '''
+
+    def initial(self, request, *args, **kwargs):
+        start = time.perf_counter()
+        super(InstrumentedAPIMixin, self).initial(request, *args, **kwargs)
+        record_time('api_checks', time.perf_counter() - start)
+        self._handler_start = time.perf_counter()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        stats = current_stats()
+        if stats is not None:
+            stats.action = getattr(self, 'action', None) or request.method.lower()
+            if hasattr(self, '_handler_start'):
+                record_time('api_handler', time.perf_counter() - self._handler_start)
+        return super(InstrumentedAPIMixin, self).finalize_response(request, response,
+                                                                    *args, **kwargs)
+
+
+class QueryBudgetMixin(object):
+    '''
+    test case assertions failing when a view runs
+    more queries than its budget
+    '''
+
+    query_budgets = {}
+
+    def assertQueryBudget(self, response, budget=None):
+        summary = getattr(response, 'instrumentation', None)
+        if summary is None:
+            self.fail('the request was not instrumented, is REQUEST_INSTRUMENTATION set?')
+        if budget is None:
+            budget = self.query_budgets.get(summary['view'], summary['budget'])
+        if budget is None:
+            self.fail('no query budget for the view {}'.format(summary['view']))
+        if summary['queries'] > budget:
+            self.fail('{} ran {} queries, over its budget of {}. repeated queries:\n{}'.format(
+                        summary['view'], summary['queries'], budget,
+                        '\n'.join('{} x {}'.format(count, sql)
+                                    for sql, count in summary['duplicates'].items())))
@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.benchmark import run_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Times the main pages and API endpoints and writes the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*',
+                            help='names of the benchmarks to run, all by default')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='number of requests once the caches are warm')
+        parser.add_argument('--password', default='bench',
+                            help='password of the students, used by the API')
+        parser.add_argument('--host', default='localhost',
+                            help='host of the requests, allowed by the settings')
+        parser.add_argument('--label',
+                            help='recorded with the results, e.g. the commit benchmarked')
+        parser.add_argument('--output',
+                            help='file written instead of the standard output')
+
+    def handle(self, *args, **options):
+        try:
+            results = run_benchmarks(repeat=options['repeat'],
+                                        password=options['password'],
+                                        host=options['host'],
+                                        names=options['names'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        results['label'] = options['label']
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
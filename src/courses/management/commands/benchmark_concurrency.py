@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.benchmark import run_concurrency_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Measures the read throughput of the database while students enroll concurrently'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4,
+                            help='number of reading threads')
+        parser.add_argument('--writers', type=int, default=1,
+                            help='number of writing threads')
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--journal-mode', action='append', dest='journal_modes',
+                            help='SQLite journal mode to compare, e.g. delete and wal. '
+                                 'it is changed for good, use a copy of the database')
+
+    def handle(self, *args, **options):
+        results = []
+        try:
+            for journal_mode in options['journal_modes'] or [None]:
+                results.append(run_concurrency_benchmark(readers=options['readers'],
+                                                            writers=options['writers'],
+                                                            seconds=options['seconds'],
+                                                            journal_mode=journal_mode))
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,24 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from courses.benchmark import run_render_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Times the rendering of a large module by the render_module_contents '
+            'tag against the previous templates and writes the results as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--contents', type=int, default=500,
+                            help='number of contents of the module rendered')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='number of renderings once the caches are warm')
+        parser.add_argument('--label',
+                            help='recorded with the results, e.g. the commit benchmarked')
+
+    def handle(self, *args, **options):
+        results = run_render_benchmark(contents=options['contents'],
+                                        repeat=options['repeat'])
+        results['label'] = options['label']
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from courses.plans import check_plans
+
+
+class Command(BaseCommand):
+    help = 'Explains the hot querysets of the views and fails ' \
+           'if any needs a full table scan or a temporary sort'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            results = check_plans()
+            # the planner settings changed by the checks are discarded
+            transaction.set_rollback(True)
+        failed = 0
+        for name, plan, problems in results:
+            self.stdout.write('{}: {}'.format(name, 'FAIL' if problems else 'ok'))
+            if options['verbosity'] > 1 or problems:
+                for line in plan:
+                    self.stdout.write('    {}'.format(line))
+            failed += bool(problems)
+        if failed:
+            raise CommandError('{} of {} querysets need an index'.format(failed, len(results)))
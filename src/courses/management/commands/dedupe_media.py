@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from courses.models import File, Image
+from courses.signals import bump_item_pages
+from courses.storage import content_storage
+
+
+class Command(BaseCommand):
+    help = 'Moves the existing uploads into the content-addressed storage, ' \
+           'storing each unique file once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='number of distinct files moved per transaction')
+
+    def handle(self, *args, **options):
+        moved = 0
+        stored = set()
+        for model in (File, Image):
+            names = [name for name in model.objects.order_by()
+                                                    .values_list('file', flat=True)
+                                                    .distinct()
+                    if name and not content_storage.is_blob(name)]
+            for start in range(0, len(names), options['batch_size']):
+                batch = names[start:start + options['batch_size']]
+                blobs = {}
+                for name in batch:
+                    if not content_storage.exists(name):
+                        self.stderr.write('missing file {}'.format(name))
+                        continue
+                    with content_storage.open(name) as content:
+                        blobs[name] = content_storage.save(name, content)
+                with transaction.atomic():
+                    # point every row to the blob of its file, the
+                    # pages displaying them are rendered again
+                    rows = model.objects.filter(file__in=list(blobs))
+                    item_ids = list(rows.values_list('id', flat=True))
+                    for name, blob in blobs.items():
+                        model.objects.filter(file=name).update(file=blob,
+                                                                updated=timezone.now())
+                    bump_item_pages(model, item_ids)
+                for name in blobs:
+                    content_storage.delete(name)
+                moved += len(blobs)
+                stored.update(blobs.values())
+        self.stdout.write('{} files moved into {} blobs'.format(moved, len(stored)))
@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.enrollment import (read_users, parse_argument, resolve_courses,
+                                resolve_users, enroll_users)
+
+
+class Command(BaseCommand):
+    help = 'Enrolls the users listed by a CSV or JSON file in the given courses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('courses', nargs='+',
+                            help='ids or slugs of the courses')
+        parser.add_argument('--users', default='-',
+                            help='file listing the users, the standard input by default')
+        parser.add_argument('--format', choices=['csv', 'json'],
+                            help='format of the file, guessed from its extension by default')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='number of users resolved and enrolled per query')
+
+    def handle(self, *args, **options):
+        courses, unknown = resolve_courses([parse_argument(course)
+                                            for course in options['courses']])
+        if unknown:
+            raise CommandError('unknown courses: {}'.format(', '.join(map(str, unknown))))
+        format = options['format'] or ('json' if options['users'].endswith('.json') else 'csv')
+        stream = sys.stdin if options['users'] == '-' else open(options['users'])
+        try:
+            users = read_users(stream, format)
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        user_ids, unknown = resolve_users(users, batch_size=options['batch_size'])
+        if unknown:
+            self.stderr.write('{} unknown users skipped, e.g. {}'.format(len(unknown), unknown[0]))
+        enrolled = enroll_users(courses, user_ids, batch_size=options['batch_size'])
+        for course in courses:
+            self.stdout.write('{} users enrolled in {}'.format(enrolled[course.id], course.slug))
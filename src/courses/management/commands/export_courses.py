@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from courses.transfer import export_courses
+
+
+class Command(BaseCommand):
+    help = 'Exports the course trees as JSON lines, with a manifest of their stored files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', default='-',
+                            help='file written, the standard output by default')
+        parser.add_argument('--subject', action='append', dest='subjects',
+                            help='slug of a subject to export, may be repeated')
+        parser.add_argument('--media-manifest',
+                            help='file listing the stored files used by the courses')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='number of courses loaded at once')
+
+    def handle(self, *args, **options):
+        output = sys.stdout if options['output'] == '-' else open(options['output'], 'w')
+        manifest = options['media_manifest'] and open(options['media_manifest'], 'w')
+        try:
+            exported = export_courses(output,
+                                        batch_size=options['batch_size'],
+                                        subjects=options['subjects'],
+                                        manifest=manifest or None)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+            if manifest:
+                manifest.close()
+        self.stderr.write('{} courses exported'.format(exported))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from courses.benchmark import generate_catalogue
+
+
+class Command(BaseCommand):
+    help = 'Generates a synthetic catalogue with its instructors and students for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subjects', type=int, default=10)
+        parser.add_argument('--courses', type=int, default=100)
+        parser.add_argument('--modules', type=int, default=10,
+                            help='number of modules per course')
+        parser.add_argument('--contents', type=int, default=10,
+                            help='number of contents per module')
+        parser.add_argument('--instructors', type=int, default=10)
+        parser.add_argument('--students', type=int, default=100)
+        parser.add_argument('--enrollments', type=int, default=5,
+                            help='number of courses joined by each student')
+        parser.add_argument('--password', default='bench',
+                            help='password of all the generated users')
+        parser.add_argument('--prefix', default='bench',
+                            help='prefix of the generated slugs and usernames')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='number of records inserted per transaction')
+
+    def handle(self, *args, **options):
+        created = generate_catalogue(subjects=options['subjects'],
+                                        courses=options['courses'],
+                                        modules=options['modules'],
+                                        contents=options['contents'],
+                                        instructors=options['instructors'],
+                                        students=options['students'],
+                                        enrollments=options['enrollments'],
+                                        password=options['password'],
+                                        prefix=options['prefix'],
+                                        seed=options['seed'],
+                                        batch_size=options['batch_size'])
+        self.stdout.write('{} courses generated'.format(created))
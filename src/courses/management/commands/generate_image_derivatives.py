@@ -0,0 +1,27 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from courses.images import generate_derivatives
+from courses.models import Image
+from courses.signals import store_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Generates the missing derivatives of the existing images in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='number of processes, all the cores by default')
+
+    def handle(self, *args, **options):
+        names = list(Image.objects.order_by().values_list('file', flat=True).distinct())
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            results = list(executor.map(generate_derivatives, names, chunksize=16))
+        processed = 0
+        for name, (width, widths) in zip(names, results):
+            # and invalidates the pages displaying the images changed
+            store_derivatives(name, width, widths)
+            processed += bool(widths)
+        self.stdout.write('{} of {} images have derivatives'.format(processed, len(names)))
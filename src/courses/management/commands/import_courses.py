@@ -0,0 +1,45 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.transfer import import_courses, missing_media
+
+
+class Command(BaseCommand):
+    help = 'Imports the course trees exported by export_courses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', nargs='?', default='-',
+                            help='file read, the standard input by default')
+        parser.add_argument('--owner',
+                            help='username of the owner of the objects whose owner is unknown')
+        parser.add_argument('--media-manifest',
+                            help='manifest of the export, to check the files were copied')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='number of records inserted per transaction')
+
+    def handle(self, *args, **options):
+        if options['media_manifest']:
+            with open(options['media_manifest']) as manifest:
+                missing = missing_media(manifest)
+            if missing:
+                raise CommandError('{} files of the manifest are missing, e.g. {}'.format(
+                                    len(missing), missing[0]))
+        owner = None
+        if options['owner']:
+            owner = User.objects.filter(username=options['owner']).first()
+            if owner is None:
+                raise CommandError('unknown user {}'.format(options['owner']))
+        stream = sys.stdin if options['input'] == '-' else open(options['input'])
+        try:
+            imported, skipped = import_courses(stream,
+                                                batch_size=options['batch_size'],
+                                                default_owner=owner)
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write('{} courses imported, {} already existing skipped'.format(
+                            imported, skipped))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from courses.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Repairs the denormalized counters of subjects and courses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='number of objects checked per transaction')
+
+    def handle(self, *args, **options):
+        repaired = reconcile_counters(batch_size=options['batch_size'])
+        self.stdout.write('{} objects repaired'.format(repaired))
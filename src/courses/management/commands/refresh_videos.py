@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import Video
+from courses.signals import refresh_video
+
+
+class Command(BaseCommand):
+    help = 'Resolves the embed codes and thumbnails of the existing videos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true',
+                            help='only the videos never resolved')
+
+    def handle(self, *args, **options):
+        videos = Video.objects.order_by('id')
+        if options['missing']:
+            videos = videos.filter(embeds='')
+        ids = list(videos.values_list('id', flat=True))
+        for video_id in ids:
+            refresh_video(video_id)
+        resolved = Video.objects.filter(id__in=ids).exclude(embeds='').count()
+        self.stdout.write('{} of {} videos resolved'.format(resolved, len(ids)))
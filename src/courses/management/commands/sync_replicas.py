@@ -0,0 +1,27 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Copies the SQLite primary database to the local read replicas'
+
+    def handle(self, *args, **options):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas:
+            raise CommandError('no replica configured, see EDUCA_READ_REPLICAS')
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError('only SQLite replicas are copied, use the '
+                               'replication of the database server instead')
+        primary.ensure_connection()
+        for alias in replicas:
+            replica = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                # a consistent copy, even while the primary is written
+                primary.connection.backup(replica)
+            finally:
+                replica.close()
+            self.stdout.write('{} synced'.format(alias))
@@ -0,0 +1,132 @@
+'''
+efficient delivery of the uploaded files: conditional
+requests, byte ranges for resuming large downloads and
+zero-copy transfers, either through the file wrapper of
+the WSGI server or handed off to the front web server
+'''
+
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.http import (FileResponse, HttpResponse,
+                            HttpResponseNotModified, StreamingHttpResponse)
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def get_etag(stats):
+    return '"{:x}-{:x}"'.format(int(stats.st_mtime), stats.st_size)
+
+
+def not_modified(request, etag, stats):
+    '''
+    whether the copy held by the client is still valid
+    '''
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return modified_since is not None and int(stats.st_mtime) <= modified_since
+
+
+def get_range(request, etag, size):
+    '''
+    returns the (start, end) bytes requested, None to send the
+    whole file, or False when the range cannot be satisfied.
+    multiple ranges are answered with the whole file
+    '''
+
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range.strip() != etag:
+        # the file changed since the client got its first part
+        return None
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # the last bytes of the file
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def iter_range(path, start, end):
+    '''
+    reads the requested bytes by chunks
+    '''
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, name, path):
+    '''
+    returns the response delivering the file stored under name
+    '''
+
+    stats = os.stat(path)
+    if not stat.S_ISREG(stats.st_mode):
+        raise FileNotFoundError(path)
+    etag = get_etag(stats)
+    if not_modified(request, etag, stats):
+        response = HttpResponseNotModified()
+    else:
+        content_type, encoding = mimetypes.guess_type(path)
+        content_type = content_type or 'application/octet-stream'
+        accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+        if accel_prefix or getattr(settings, 'MEDIA_SENDFILE', False):
+            byte_range = None
+        else:
+            byte_range = get_range(request, etag, stats.st_size)
+        if accel_prefix:
+            # the front server sends the file and handles the ranges
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = accel_prefix + name
+        elif getattr(settings, 'MEDIA_SENDFILE', False):
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = path
+        elif byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{}'.format(stats.st_size)
+        elif byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(iter_range(path, start, end),
+                                                status=206,
+                                                content_type=content_type)
+            response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, stats.st_size)
+            response['Content-Length'] = end - start + 1
+        else:
+            # sent with the file wrapper of the server, e.g. sendfile()
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response['Content-Length'] = stats.st_size
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stats.st_mtime)
+    # only the enrolled users can see the file
+    patch_cache_control(response, private=True)
+    return response
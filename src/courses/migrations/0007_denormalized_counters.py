@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    '''
+    computes the counters of the existing subjects and courses
+    '''
+
+    Subject = apps.get_model('courses', 'Subject')
+    Course = apps.get_model('courses', 'Course')
+    Module = apps.get_model('courses', 'Module')
+    Content = apps.get_model('courses', 'Content')
+    # the default orderings are cleared, they would be grouped by too
+    courses = dict(Course.objects.order_by().values_list('subject_id')
+                                    .annotate(total=Count('id')))
+    for subject_id in Subject.objects.values_list('id', flat=True):
+        Subject.objects.filter(id=subject_id).update(course_count=courses.get(subject_id, 0))
+    modules = dict(Module.objects.order_by().values_list('course_id')
+                                    .annotate(total=Count('id')))
+    contents = dict(Content.objects.order_by().values_list('module__course_id')
+                                    .annotate(total=Count('id')))
+    students = dict(Course.users.through.objects.order_by().values_list('course_id')
+                                                    .annotate(total=Count('id')))
+    for course_id in Course.objects.values_list('id', flat=True):
+        Course.objects.filter(id=course_id).update(module_count=modules.get(course_id, 0),
+                                                    student_count=students.get(course_id, 0),
+                                                    content_count=contents.get(course_id, 0))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_catalogue_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='content_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='module_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='student_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='course_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:38
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    '''
+    creates the FTS5 index on SQLite and fills it
+    with the existing courses, modules and texts
+    '''
+
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Course = apps.get_model('courses', 'Course')
+    Module = apps.get_model('courses', 'Module')
+    Content = apps.get_model('courses', 'Content')
+    Text = apps.get_model('courses', 'Text')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    rows = [(course.id * 4 + 1, course.id, course.title, course.overview)
+            for course in Course.objects.all()]
+    rows += [(module.id * 4 + 2, module.course_id, module.title, module.description)
+                for module in Module.objects.all()]
+    text_type = ContentType.objects.filter(app_label='courses', model='text').first()
+    if text_type:
+        courses = dict(Content.objects.filter(content_type=text_type)
+                                        .values_list('object_id', 'module__course_id'))
+        rows += [(text.id * 4 + 3, courses[text.id], text.title, text.content)
+                    for text in Text.objects.filter(id__in=list(courses))]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('CREATE VIRTUAL TABLE IF NOT EXISTS courses_search USING fts5('
+                        'course_id UNINDEXED, title, body, '
+                        'tokenize="porter unicode61")')
+        cursor.executemany('INSERT INTO courses_search (rowid, course_id, title, body) '
+                            'VALUES (%s, %s, %s, %s)', rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS courses_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('courses', '0008_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
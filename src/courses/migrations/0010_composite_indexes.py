@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:45
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='content',
+            index=models.Index(fields=['module', 'order'], name='courses_con_module__93918d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='content',
+            index=models.Index(fields=['content_type', 'object_id'], name='courses_con_content_440b54_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['subject', '-created', '-id'], name='courses_cou_subject_6a3067_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='module',
+            index=models.Index(fields=['course', 'order'], name='courses_mod_course__20183c_idx'),
+        ),
+        # the courses joined by a user, the unique index of the
+        # auto-created through table starts with the course
+        migrations.RunSQL(
+            ['CREATE INDEX courses_course_users_user_course_idx '
+             'ON courses_course_users (user_id, course_id)'],
+            ['DROP INDEX courses_course_users_user_course_idx'],
+        ),
+    ]
@@ -12,28 +12,156 @@ Subject 1
             ...
 '''
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
-from django.template.loader import render_to_string
+from django.template.loader import get_template
 from django.utils.safestring import mark_safe
 
 from .fields import OrderField
+from .cache import render_key, render_items
+from .storage import content_storage
+from .images import get_srcset
+from .videos import get_embed_code, DEFAULT_SIZE
 
 
-class Subject(models.Model):
+class OrderedQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, batch_size=None):
+        '''
+        gives consecutive orders to the objects created
+        for the same parent from a single query
+        '''
+
+        objs = list(objs)
+        self._for_write = True
+        with transaction.atomic(using=self.db, savepoint=False):
+            for field in self.model._meta.concrete_fields:
+                if isinstance(field, OrderField):
+                    field.allocate(objs)
+            return super(OrderedQuerySet, self).bulk_create(objs, batch_size)
+
+    def reorder(self, orders):
+        '''
+        applies an {id: order} mapping of distinct positive orders
+        to the objects of the queryset, ignoring ids outside of it.
+        the siblings of the objects moved are then numbered from 0
+        in the resulting order, the objects moved going first on
+        ties, and written by a single UPDATE statement. the orders
+        of all those siblings are returned
+        '''
+
+        field = next(field for field in self.model._meta.concrete_fields
+                        if isinstance(field, OrderField))
+        orders = {int(id): int(order) for id, order in orders.items()}
+        if any(order < 0 for order in orders.values()):
+            raise ValueError('the orders must be positive')
+        if len(set(orders.values())) < len(orders):
+            raise ValueError('the orders must be distinct')
+        attnames = [self.model._meta.get_field(name).attname
+                    for name in field.for_fields or []]
+        manager = self.model._default_manager.using(self.db)
+        self._for_write = True
+        with transaction.atomic(using=self.db, savepoint=False):
+            # checks the ownership of all the objects at once
+            moved = {row[0]: tuple(zip(attnames, row[1:]))
+                        for row in self.filter(id__in=orders).values_list('id', *attnames)}
+            if not moved:
+                return {}
+            groups = set(moved.values())
+            field.lock_parents(groups, self.db)
+            query = models.Q()
+            for group in groups:
+                query |= models.Q(**dict(group))
+            members, current = {}, {}
+            for row in manager.filter(query).values_list('id', field.attname, *attnames):
+                id, order = row[:2]
+                current[id] = order
+                members.setdefault(row[2:], []).append(
+                    (orders[id], 0, id) if id in moved else (order, 1, id))
+            canonical = {}
+            for group in members.values():
+                for position, (order, rank, id) in enumerate(sorted(group)):
+                    canonical[id] = position
+            changed = [id for id, order in canonical.items() if current[id] != order]
+            if changed:
+                manager.filter(id__in=changed).update(
+                    **{field.attname: models.Case(
+                                        *[models.When(id=id, then=models.Value(canonical[id]))
+                                            for id in changed],
+                                        output_field=field)})
+        return {id: canonical[id] for id in sorted(canonical, key=canonical.get)}
+
+
+def contents_prefetch():
+    return models.Prefetch('contents',
+                            queryset=Content.objects.with_items()
+                                                    .order_by('module_id', 'order'))
+
+
+class ModuleQuerySet(OrderedQuerySet):
+
+    def with_contents(self):
+        '''
+        prefetch the contents of each module
+        together with their items, sorted along
+        the (module, order) index
+        '''
+
+        return self.prefetch_related(contents_prefetch())
+
+
+class ContentQuerySet(OrderedQuerySet):
+
+    def with_items(self):
+        '''
+        resolve the item generic foreign key of all
+        contents at once, grouping them by content type
+        so that each item model is loaded with a single
+        IN query whatever the number of contents
+        '''
+
+        # the prefetch looks up the content types one at a time,
+        # those of the items are cached with a single query instead
+        ContentType.objects.get_for_models(Text, Video, Image, File)
+        return self.prefetch_related('item')
+
+
+class CountersMixin(object):
+    '''
+    keeps the denormalized counters out of the updates
+    of existing objects, so saving an outdated instance
+    never overwrites the values maintained by the receivers
+    '''
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('update_fields'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                        if not field.primary_key
+                                        and field.name not in self.counter_fields]
+        super(CountersMixin, self).save(*args, **kwargs)
+
+
+class Subject(CountersMixin, models.Model):
     title   = models.CharField(max_length=200)
     slug    = models.SlugField(max_length=200, unique=True)
+    # maintained by the signal receivers
+    course_count = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ('course_count', )
 
     def __str__(self):
         return str(self.title)
 
     class Meta:
         ordering = ('title', )
+        indexes = [models.Index(fields=['title', 'id'])]
 
 
-class Course(models.Model):
+class Course(CountersMixin, models.Model):
     '''
     each course belongs to an owner and a specific subject
     '''
@@ -47,12 +175,21 @@ class Course(models.Model):
     slug        = models.SlugField(max_length=200, unique=True)
     overview    = models.TextField()
     created     = models.DateTimeField(auto_now_add=True)
+    # maintained by the signal receivers
+    module_count    = models.PositiveIntegerField(default=0, editable=False)
+    content_count   = models.PositiveIntegerField(default=0, editable=False)
+    student_count   = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields  = ('module_count', 'content_count', 'student_count')
 
     def __str__(self):
         return str(self.title)
 
     class Meta:
         ordering = ('-created', )
+        # keyset pagination of the catalogue and of the subject listings
+        indexes = [models.Index(fields=['-created', '-id']),
+                    models.Index(fields=['subject', '-created', '-id'])]
 
 
 class Module(models.Model):
@@ -66,11 +203,14 @@ class Module(models.Model):
     description = models.TextField(blank=True)
     order       = OrderField(blank=True, for_fields=['course'])
 
+    objects     = ModuleQuerySet.as_manager()
+
     def __str__(self):
         return '{}.{}'.format(self.order, self.title)
 
     class Meta:
         ordering = ['order']
+        indexes = [models.Index(fields=['course', 'order'])]
 
 
 class Content(models.Model):
@@ -93,8 +233,13 @@ class Content(models.Model):
     item            = GenericForeignKey('content_type', 'object_id')
     order           = OrderField(blank=True, for_fields=['module'])
 
+    objects         = ContentQuerySet.as_manager()
+
     class Meta:
         ordering = ['order']
+        # contents of a module in order, and contents displaying an item
+        indexes = [models.Index(fields=['module', 'order']),
+                    models.Index(fields=['content_type', 'object_id'])]
 
 
 class ItemBase(models.Model):
@@ -112,13 +257,29 @@ class ItemBase(models.Model):
     def render(self):
         '''
         a common interface for rendering
-        diverse content
+        diverse content, served from the render cache
+        '''
+
+        rendered = getattr(self, '_rendered', None)
+        if rendered and rendered[0] == render_key(self):
+            # already rendered along with the other items of the page
+            return mark_safe(rendered[1])
+        return render_items([self])[0]
+
+    @classmethod
+    def get_template(cls):
+        return get_template('courses/content/{}.html'.format(cls._meta.model_name))
+
+    def render_template(self, template=None):
+        '''
+        renders the template of the content
+        without going through the cache, the
+        template may be given when already loaded
         '''
 
-        return render_to_string(
-                        'courses/content/{}.html'.format(self._meta.model_name),
-                        {'item': self}
-                        )
+        if template is None:
+            template = self.get_template()
+        return template.render({'item': self})
 
     def __str__(self):
         return str(self.title)
@@ -132,16 +293,46 @@ class Text(ItemBase):
 
 
 class File(ItemBase):
-    file = models.FileField(upload_to='files')
+    # indexed to look up the items of a stored file
+    file = models.FileField(upload_to='files', storage=content_storage, db_index=True)
 
 
 class Image(ItemBase):
-    file = models.FileField(upload_to='images')
+    '''
+    the widths of the image and of its resized variants
+    are stored once they are generated in the background
+    '''
+
+    file                = models.FileField(upload_to='images', storage=content_storage,
+                                        db_index=True)
+    width               = models.PositiveIntegerField(null=True, editable=False)
+    # comma separated widths of the derivatives
+    derivative_widths   = models.CharField(max_length=100, blank=True, editable=False)
+
+    def srcset(self):
+        '''
+        the resized variants, without reading the stored files
+        '''
+
+        return get_srcset(self.file.name, self.width, self.derivative_widths)
 
 
 class Video(ItemBase):
     '''
-    a url must be provided to embed a video
+    a url must be provided to embed a video.
+    its metadata is resolved when it is saved
     '''
 
-    url = models.URLField()
+    url             = models.URLField()
+    provider        = models.CharField(max_length=50, blank=True, editable=False)
+    video_id        = models.CharField(max_length=100, blank=True, editable=False)
+    # JSON object of the embed code of each size
+    embeds          = models.TextField(blank=True, editable=False)
+    thumbnail_url   = models.URLField(max_length=500, blank=True, editable=False)
+
+    def embed_code(self, size=DEFAULT_SIZE):
+        '''
+        the stored embed code, empty until resolved
+        '''
+
+        return get_embed_code(self, size)
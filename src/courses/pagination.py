@@ -0,0 +1,88 @@
+'''
+keyset (cursor) pagination for the HTML lists.
+instead of an offset, each page starts right after
+the ordering values of the last row of the previous one,
+so deep pages cost as much as the first one. the cursors
+are signed, so only those of actual pages are accepted
+and they can safely be part of the cache keys
+'''
+
+from django.core import signing
+from django.db.models import Q
+from django.http import Http404
+
+
+class KeysetPaginator(object):
+    '''
+    paginates a queryset of model instances or
+    dictionaries ordered by the given unique ordering
+    '''
+
+    def __init__(self, model, ordering, page_size=20):
+        self.model = model
+        self.ordering = ordering
+        self.page_size = page_size
+
+    def get_value(self, row, name):
+        if isinstance(row, dict):
+            return row[name]
+        return getattr(row, name)
+
+    @property
+    def salt(self):
+        return 'keyset:{}'.format(self.model._meta.label_lower)
+
+    def encode_cursor(self, row):
+        values = [str(self.get_value(row, field.lstrip('-')))
+                    for field in self.ordering]
+        return signing.dumps(values, salt=self.salt)
+
+    def decode_cursor(self, cursor):
+        '''
+        returns the ordering values of the row
+        the page starts after
+        '''
+
+        try:
+            values = signing.loads(cursor, salt=self.salt)
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [self.model._meta.get_field(field.lstrip('-')).to_python(value)
+                    for field, value in zip(self.ordering, values)]
+        except Exception:
+            raise Http404('Invalid cursor.')
+
+    def after(self, values):
+        '''
+        lookup of the rows following the given ordering values
+        '''
+
+        query = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = '{}__{}'.format(name, 'lt' if field.startswith('-') else 'gt')
+            equal = {previous.lstrip('-'): value
+                        for previous, value in zip(self.ordering[:index], values)}
+            equal[lookup] = values[index]
+            query |= Q(**equal)
+        # bounds the first column on its own, so the index
+        # is searched from the cursor instead of scanned
+        first = self.ordering[0]
+        bound = '{}__{}'.format(first.lstrip('-'), 'lte' if first.startswith('-') else 'gte')
+        return Q(**{bound: values[0]}) & query
+
+    def get_page(self, queryset, cursor=None):
+        '''
+        returns the rows of the page starting after the
+        cursor and the cursor of the next page, if any
+        '''
+
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor)))
+        rows = list(queryset[:self.page_size + 1])
+        next_cursor = None
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            next_cursor = self.encode_cursor(rows[-1])
+        return rows, next_cursor
@@ -0,0 +1,127 @@
+'''
+query plans of the hot querysets of the views, checked for
+full table scans and temporary sorts, which mean an index
+is missing. SQLite, PostgreSQL and MySQL plans are understood
+'''
+
+import re
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.utils import timezone
+
+from .models import Subject, Course, Module, Content, Text, File, Image
+from .pagination import KeysetPaginator
+
+
+# a scan is only bounded by the constraint of the index it searches
+SQLITE_SEARCH = re.compile(r'USING (?:COVERING )?INDEX \w+ \(.+\)$')
+
+
+def get_plan_checks():
+    '''
+    the (name, queryset, full_scan_allowed) of the querysets checked,
+    built like the views build them, for arbitrary ids
+    '''
+
+    text_type = ContentType.objects.get_for_model(Text)
+    catalogue = Course.objects.values('id', 'title', 'slug', 'created',
+                                        'subject__title', 'subject__slug',
+                                        'owner__first_name', 'owner__last_name',
+                                        'module_count')
+    paginator = KeysetPaginator(Course, ('-created', '-id'))
+    return [
+        # all the subjects are listed, in the order of their index
+        ('subjects', Subject.objects.values('id', 'title', 'slug', 'course_count'), True),
+        # the first page walks the index of the order, stopped by the limit
+        ('catalogue', catalogue.order_by('-created', '-id')[:21], True),
+        ('catalogue_next_page',
+            catalogue.filter(paginator.after([timezone.now(), 1]))
+                        .order_by('-created', '-id')[:21], False),
+        ('catalogue_deep_page',
+            catalogue.filter(paginator.after([timezone.now() - timedelta(days=3650), 10 ** 6]))
+                        .order_by('-created', '-id')[:21], False),
+        ('subject_courses',
+            catalogue.filter(subject_id=1).order_by('-created', '-id')[:21], False),
+        ('subject_courses_next_page',
+            catalogue.filter(paginator.after([timezone.now(), 1]), subject_id=1)
+                        .order_by('-created', '-id')[:21], False),
+        ('course_by_slug', Course.objects.filter(slug='python'), False),
+        ('course_modules', Module.objects.filter(course_id=1), False),
+        ('first_module', Module.objects.filter(course_id=1).values_list('id')[:1], False),
+        ('module_contents', Content.objects.filter(module_id=1), False),
+        ('module_contents_of_modules',
+            Content.objects.filter(module_id__in=[1, 2]).order_by('module_id', 'order'), False),
+        ('item_contents',
+            Content.objects.filter(content_type=text_type, object_id=1)
+                            .order_by().values_list('module_id'), False),
+        ('items', Text.objects.filter(id__in=[1, 2]), False),
+        ('enrolled_courses',
+            Course.users.through.objects.filter(user_id=1).values_list('course_id'), False),
+        ('course_students',
+            Course.users.through.objects.filter(course_id=1).values_list('user_id'), False),
+        # the items of a stored file, when it is served or released
+        ('file_items',
+            File.objects.filter(file__in=['files/a.pdf', 'files/b.pdf'])
+                        .values_list('id', 'owner_id'), False),
+        ('image_items',
+            Image.objects.filter(file__in=['images/a.jpg', 'images/b.jpg'])
+                            .values_list('id', 'owner_id'), False),
+    ]
+
+
+def explain(queryset):
+    '''
+    the lines of the query plan of the queryset
+    '''
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == 'postgresql':
+            # what remains after discouraging them cannot be avoided
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute('EXPLAIN ' + sql, params)
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute('EXPLAIN ' + sql, params)
+        columns = [column[0] for column in cursor.description]
+        return ['{table}: type={type} key={key} extra={Extra}'.format(
+                    **dict(zip(columns, row))) for row in cursor.fetchall()]
+
+
+def get_plan_problems(plan, full_scan_allowed=False):
+    '''
+    the lines of the plan showing a full scan or a temporary sort
+    '''
+
+    problems = []
+    for line in plan:
+        detail = line.strip().lstrip('-> ')
+        if connection.vendor == 'sqlite':
+            scan = detail.startswith('SCAN') and not SQLITE_SEARCH.search(detail)
+            sort = 'TEMP B-TREE' in detail
+        elif connection.vendor == 'postgresql':
+            scan = detail.startswith('Seq Scan')
+            sort = detail.startswith('Sort')
+        else:
+            scan = 'type=ALL' in detail
+            sort = 'filesort' in detail or 'temporary' in detail
+        if sort or (scan and not full_scan_allowed):
+            problems.append(detail)
+    return problems
+
+
+def check_plans():
+    '''
+    returns the (name, plan, problems) of each checked queryset
+    '''
+
+    results = []
+    for name, queryset, full_scan_allowed in get_plan_checks():
+        plan = explain(queryset)
+        results.append((name, plan, get_plan_problems(plan, full_scan_allowed)))
+    return results
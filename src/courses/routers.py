@@ -0,0 +1,138 @@
+'''
+routing of the read-only requests of the catalogue to the read
+replicas. the views opt in with the mixins below, and every
+other query goes to the primary database. a user who just wrote
+something is pinned to the primary for a while, so they always
+read their own writes despite the replication lag
+'''
+
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+
+
+REPLICAS = getattr(settings, 'DATABASE_REPLICAS', [])
+
+# the sessions and users are always read from the primary,
+# a session missing from a replica would log the user out
+REPLICA_APPS = getattr(settings, 'REPLICA_APPS', ('courses', ))
+
+PIN_COOKIE = getattr(settings, 'REPLICA_PIN_COOKIE', 'replica_pin')
+PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_local = threading.local()
+
+
+def read_from_replicas():
+    '''
+    sends the next reads of the request to the replicas
+    '''
+
+    _local.replica_reads = True
+
+
+@contextmanager
+def read_from_primary():
+    '''
+    sends the reads of the block to the primary, for the data
+    cached until the next change, which a lagging replica would
+    keep stale for as long as the cache holds it
+    '''
+
+    replica_reads = getattr(_local, 'replica_reads', False)
+    _local.replica_reads = False
+    try:
+        yield
+    finally:
+        _local.replica_reads = replica_reads
+
+
+def reset_state(pinned=False):
+    _local.replica_reads = False
+    _local.pinned = pinned
+    _local.wrote = False
+
+
+def replica_allowed():
+    return (getattr(_local, 'replica_reads', False)
+            and not getattr(_local, 'pinned', False)
+            and not getattr(_local, 'wrote', False))
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if REPLICAS and model._meta.app_label in REPLICA_APPS and replica_allowed():
+            return random.choice(REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # the rest of the request reads from the primary
+        _local.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinningMiddleware(object):
+    '''
+    pins the requests of a client to the primary for a few
+    seconds after they wrote, through a cookie. it must come
+    before the session middleware, which may write as well
+    '''
+
+    def __init__(self, get_response):
+        if not REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        reset_state(pinned=PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            wrote = _local.wrote
+        finally:
+            reset_state()
+        if wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=PIN_SECONDS, httponly=True)
+        return response
+
+
+class ReplicaReadMixin(object):
+    '''
+    reads the data of the safe requests of the view,
+    including those of its template, from a replica
+    '''
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            read_from_replicas()
+        return super(ReplicaReadMixin, self).dispatch(request, *args, **kwargs)
+
+
+class ReplicaReadAPIMixin(object):
+    '''
+    reads the data of the given actions of an API view from
+    a replica, once the user has been authenticated on the
+    primary. all the safe requests by default
+    '''
+
+    replica_actions = None
+
+    def initial(self, request, *args, **kwargs):
+        super(ReplicaReadAPIMixin, self).initial(request, *args, **kwargs)
+        action = getattr(self, 'action', None)
+        if request.method in SAFE_METHODS and (self.replica_actions is None
+                                                or action in self.replica_actions):
+            read_from_replicas()
@@ -0,0 +1,196 @@
+'''
+full-text search over the courses, their modules and
+their text contents. on SQLite the documents are kept
+in an FTS5 inverted index updated by the signal receivers,
+other databases fall back to a plain LIKE scan
+'''
+
+import re
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Course, Module, Content, Text
+
+
+TABLE = 'courses_search'
+
+COURSE, MODULE, TEXT = 'course', 'module', 'text'
+
+# the rowid of a document is derived from its kind and object id,
+# so it is replaced or removed through the rowid index
+KINDS = {COURSE: 1, MODULE: 2, TEXT: 3}
+
+KIND_NAMES = {code: kind for kind, code in KINDS.items()}
+
+
+def search_available():
+    return connection.vendor == 'sqlite'
+
+
+def create_index(cursor):
+    cursor.execute('CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5('
+                    'course_id UNINDEXED, title, body, '
+                    'tokenize="porter unicode61")'.format(TABLE))
+
+
+def rowid(kind, object_id):
+    return object_id * 4 + KINDS[kind]
+
+
+def remove_document(kind, object_id):
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {} WHERE rowid = %s'.format(TABLE),
+                        [rowid(kind, object_id)])
+
+
+def insert_documents(documents, replace=False):
+    '''
+    indexes (kind, object_id, course_id, title, body) documents,
+    replacing their previous version if asked
+    '''
+
+    rows = [(rowid(kind, object_id), course_id, title, body)
+            for kind, object_id, course_id, title, body in documents]
+    if rows and search_available():
+        with connection.cursor() as cursor:
+            if replace:
+                cursor.executemany('DELETE FROM {} WHERE rowid = %s'.format(TABLE),
+                                    [row[:1] for row in rows])
+            cursor.executemany('INSERT INTO {} (rowid, course_id, title, body) '
+                                'VALUES (%s, %s, %s, %s)'.format(TABLE), rows)
+    return len(rows)
+
+
+def add_documents(documents):
+    insert_documents(documents, replace=True)
+
+
+def course_document(course):
+    return (COURSE, course.id, course.id, course.title, course.overview)
+
+
+def module_document(module):
+    return (MODULE, module.id, module.course_id, module.title, module.description)
+
+
+def text_documents(texts):
+    '''
+    documents of the given texts, attached to
+    the course of the module displaying them
+    '''
+
+    texts = list(texts)
+    courses = dict(Content.objects.filter(content_type=ContentType.objects.get_for_model(Text),
+                                            object_id__in=[text.id for text in texts])
+                                    .order_by()
+                                    .values_list('object_id', 'module__course_id'))
+    return [(TEXT, text.id, courses[text.id], text.title, text.content)
+            for text in texts if text.id in courses]
+
+
+def index_text(text_id):
+    '''
+    indexes the text again, or only removes
+    it if no module displays it anymore
+    '''
+
+    remove_document(TEXT, text_id)
+    insert_documents(text_documents(Text.objects.filter(id=text_id)))
+
+
+def rebuild_index(batch_size=1000):
+    '''
+    indexes again every course, module and text, by batches
+    '''
+
+    if not search_available():
+        return 0
+    total = 0
+    sources = [(Course.objects.all(), lambda batch: map(course_document, batch)),
+                (Module.objects.all(), lambda batch: map(module_document, batch)),
+                (Text.objects.all(), text_documents)]
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(TABLE))
+            create_index(cursor)
+        for queryset, documents in sources:
+            batch = []
+            for obj in queryset.order_by('id').iterator():
+                batch.append(obj)
+                if len(batch) == batch_size:
+                    total += insert_documents(documents(batch))
+                    batch = []
+            total += insert_documents(documents(batch))
+    return total
+
+
+def parse_query(query):
+    '''
+    turns the words of the user query into FTS5 prefix terms,
+    so no operator of the FTS5 syntax can be injected
+    '''
+
+    return ' '.join('"{}"*'.format(word) for word in re.findall(r'\w+', query))
+
+
+def search(query, limit=20, subject_id=None):
+    '''
+    returns the best matches as (kind, object_id, course_id, title)
+    tuples, the titles weighting ten times more than the bodies,
+    only among the courses of the subject if one is given
+    '''
+
+    terms = parse_query(query)
+    if not terms:
+        return []
+    if not search_available():
+        return fallback_search(query, limit, subject_id)
+    condition, params = '', [terms]
+    if subject_id:
+        # filtered before the limit, so the best matches of the subject are kept
+        courses, course_params = (Course.objects.filter(subject_id=subject_id).order_by()
+                                                .values('id').query.sql_with_params())
+        condition = ' AND course_id IN ({})'.format(courses)
+        params += course_params
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT rowid, course_id, title FROM {0} '
+                        'WHERE {0} MATCH %s{1} '
+                        'ORDER BY bm25({0}, 0, 10.0, 1.0) LIMIT %s'.format(TABLE, condition),
+                        params + [limit])
+        return [(KIND_NAMES[row_id % 4], row_id // 4, int(course_id), title)
+                for row_id, course_id, title in cursor.fetchall()]
+
+
+def fallback_search(query, limit, subject_id=None):
+    courses = Course.objects.all()
+    modules = Module.objects.all()
+    if subject_id:
+        courses = courses.filter(subject_id=subject_id)
+        modules = modules.filter(course__subject_id=subject_id)
+    results = [(COURSE, course_id, course_id, title)
+                for course_id, title in courses.filter(
+                                            Q(title__icontains=query) |
+                                            Q(overview__icontains=query))
+                                        .values_list('id', 'title')[:limit]]
+    results += [(MODULE, module_id, course_id, title)
+                for module_id, course_id, title in modules.filter(
+                                            Q(title__icontains=query) |
+                                            Q(description__icontains=query))
+                                        .values_list('id', 'course_id', 'title')[:limit]]
+    return results[:limit]
+
+
+def search_courses(query, limit=20, subject_id=None):
+    '''
+    ids of the courses with the best matches, best first
+    '''
+
+    course_ids = []
+    for kind, object_id, course_id, title in search(query, limit * 5, subject_id):
+        if course_id not in course_ids:
+            course_ids.append(course_id)
+    return course_ids[:limit]
@@ -0,0 +1,355 @@
+'''
+keeps the cached catalogue, course pages and enrollments
+in sync with the database once the transaction has been committed,
+maintains the denormalized counters within the transaction,
+deletes the stored files that are no longer referenced
+queues the generation of the image derivatives,
+resolves the video embed codes and keeps the search
+index up to date
+'''
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+from django.db.models.signals import (pre_save, post_save,
+                                        post_delete, m2m_changed)
+from django.dispatch import receiver
+
+from .cache import bump_generation, bump_course_pages, forget_enrollments
+from .counters import change_count, count_students
+from .models import (Subject, Course, Module, Content, ItemBase,
+                        Text, File, Image, Video)
+from .storage import content_storage
+from .images import derivative_names, format_widths, generate_derivatives
+from .videos import resolve_video
+from . import search, tasks
+
+
+def bump_catalogue(*subject_ids):
+    '''
+    invalidates the cached lists of subjects and courses,
+    as well as the course lists of the given subjects
+    '''
+
+    names = ['catalogue'] + ['subject_{}'.format(subject_id)
+                                for subject_id in set(subject_ids) if subject_id]
+    transaction.on_commit(lambda: bump_generation(*names))
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def subject_changed(sender, instance, **kwargs):
+    bump_catalogue(instance.id)
+
+
+@receiver(pre_save, sender=Course)
+def course_saving(sender, instance, **kwargs):
+    '''
+    remember the previous subject of the course,
+    whose course list must be invalidated as well
+    '''
+
+    instance._old_subject_id = Course.objects.filter(
+                                    id=instance.id).values_list(
+                                    'subject_id', flat=True).first()
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, instance, **kwargs):
+    bump_catalogue(instance.subject_id,
+                    getattr(instance, '_old_subject_id', None))
+
+
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+def module_changed(sender, instance, **kwargs):
+    # the course may have been deleted along with its modules
+    subject_id = Course.objects.filter(
+                        id=instance.course_id).values_list(
+                        'subject_id', flat=True).first()
+    bump_catalogue(subject_id)
+    bump_course_pages([instance.course_id], [instance.id])
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def content_changed(sender, instance, **kwargs):
+    bump_course_pages(module_ids=[instance.module_id])
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def item_changed(sender, instance, **kwargs):
+    '''
+    invalidates the modules displaying the item
+    '''
+
+    if not isinstance(instance, ItemBase):
+        return
+    content_type = ContentType.objects.get_for_model(instance)
+    bump_course_pages(module_ids=Content.objects.filter(
+                                    content_type=content_type,
+                                    object_id=instance.id).order_by().values_list(
+                                    'module_id', flat=True))
+
+
+@receiver(m2m_changed, sender=Course.users.through)
+def enrollments_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    '''
+    invalidates the enrolled courses of the users
+    who joined or left a course
+    '''
+
+    if reverse:
+        # the enrollments were changed from the user side
+        user_ids = [instance.pk]
+    elif action == 'pre_clear':
+        # remember who was enrolled before the course is cleared
+        instance._cleared_user_ids = list(instance.users.values_list('id', flat=True))
+        return
+    elif action == 'post_clear':
+        user_ids = getattr(instance, '_cleared_user_ids', [])
+    else:
+        user_ids = pk_set or []
+    if action.startswith('post_') and user_ids:
+        transaction.on_commit(lambda: forget_enrollments(user_ids))
+
+
+@receiver(post_save, sender=Course)
+def count_course_saved(sender, instance, created, **kwargs):
+    old_subject_id = getattr(instance, '_old_subject_id', None)
+    if created:
+        change_count(Subject, [instance.subject_id], 'course_count', 1)
+    elif old_subject_id and old_subject_id != instance.subject_id:
+        # the course moved to another subject
+        change_count(Subject, [old_subject_id], 'course_count', -1)
+        change_count(Subject, [instance.subject_id], 'course_count', 1)
+
+
+@receiver(post_delete, sender=Course)
+def count_course_deleted(sender, instance, **kwargs):
+    change_count(Subject, [instance.subject_id], 'course_count', -1)
+
+
+@receiver(post_save, sender=Module)
+def count_module_saved(sender, instance, created, **kwargs):
+    if created:
+        change_count(Course, [instance.course_id], 'module_count', 1)
+
+
+@receiver(post_delete, sender=Module)
+def count_module_deleted(sender, instance, **kwargs):
+    change_count(Course, [instance.course_id], 'module_count', -1)
+
+
+@receiver(post_save, sender=Content)
+def count_content_saved(sender, instance, created, **kwargs):
+    if created:
+        change_count(Course,
+                        Module.objects.filter(id=instance.module_id).values('course_id'),
+                        'content_count', 1)
+
+
+@receiver(post_delete, sender=Content)
+def count_content_deleted(sender, instance, **kwargs):
+    change_count(Course,
+                    Module.objects.filter(id=instance.module_id).values('course_id'),
+                    'content_count', -1)
+
+
+@receiver(m2m_changed, sender=Course.users.through)
+def count_enrollments(sender, instance, action, reverse, pk_set, **kwargs):
+    '''
+    pk_set only holds the new enrollments when adding, so removals
+    and clears recount the students of the affected courses instead
+    '''
+
+    if not reverse:
+        if action == 'post_add' and pk_set:
+            change_count(Course, [instance.pk], 'student_count', len(pk_set))
+        elif action in ('post_remove', 'post_clear'):
+            count_students([instance.pk])
+    elif action == 'pre_clear':
+        # remember the courses the user leaves
+        instance._cleared_course_ids = list(instance.courses_joined.values_list('id', flat=True))
+    elif action == 'post_clear':
+        count_students(getattr(instance, '_cleared_course_ids', []))
+    elif action == 'post_add' and pk_set:
+        change_count(Course, pk_set, 'student_count', 1)
+    elif action == 'post_remove' and pk_set:
+        count_students(pk_set)
+
+
+def bump_item_pages(model, item_ids):
+    '''
+    invalidates the cached pages of the modules displaying the items
+    '''
+
+    bump_course_pages(module_ids=Content.objects.filter(
+                                    content_type=ContentType.objects.get_for_model(model),
+                                    object_id__in=item_ids).order_by().values_list(
+                                    'module_id', flat=True))
+
+
+def release_file(name):
+    '''
+    a stored file is shared by all the items with the same
+    content, so it is only deleted with its last reference,
+    unless the same content was uploaded again meanwhile
+    '''
+
+    if not name or any(model.objects.filter(file=name).exists()
+                        for model in (File, Image)):
+        return
+    if content_storage.is_blob(name):
+        if not content_storage.delete_if_idle(name):
+            return
+    else:
+        content_storage.delete(name)
+    for derivative in derivative_names(name):
+        content_storage.delete(derivative)
+
+
+@receiver(pre_save, sender=File)
+@receiver(pre_save, sender=Image)
+def file_saving(sender, instance, **kwargs):
+    '''
+    remember the previous file, released once replaced
+    '''
+
+    instance._old_file = sender.objects.filter(id=instance.id).values_list(
+                                                'file', flat=True).first()
+    if sender is Image and instance._old_file != instance.file.name:
+        # the widths of the previous file no longer apply
+        instance.width, instance.derivative_widths = None, ''
+
+
+@receiver(post_save, sender=File)
+@receiver(post_save, sender=Image)
+def file_saved(sender, instance, **kwargs):
+    name = getattr(instance, '_old_file', None)
+    if name and name != instance.file.name:
+        transaction.on_commit(lambda: release_file(name))
+
+
+@receiver(post_delete, sender=File)
+@receiver(post_delete, sender=Image)
+def file_deleted(sender, instance, **kwargs):
+    name = instance.file.name
+    transaction.on_commit(lambda: release_file(name))
+
+
+def store_derivatives(name, width, widths):
+    '''
+    stores the widths of the image and of its derivatives on the
+    items using it, then invalidates their rendered output so that
+    they offer them. returns the number of items changed
+    '''
+
+    items = Image.objects.filter(file=name).exclude(width=width,
+                                                    derivative_widths=format_widths(widths))
+    item_ids = list(items.values_list('id', flat=True))
+    if item_ids:
+        Image.objects.filter(id__in=item_ids).update(width=width,
+                                                    derivative_widths=format_widths(widths),
+                                                    updated=timezone.now())
+        bump_item_pages(Image, item_ids)
+    return len(item_ids)
+
+
+def refresh_derivatives(image_id):
+    '''
+    generates the derivatives of an image and stores their widths
+    '''
+
+    name = Image.objects.filter(id=image_id).values_list('file', flat=True).first()
+    if name:
+        store_derivatives(name, *generate_derivatives(name))
+
+
+@receiver(post_save, sender=Image)
+def image_saved(sender, instance, **kwargs):
+    image_id = instance.id
+    transaction.on_commit(lambda: tasks.submit(refresh_derivatives, image_id))
+
+
+@receiver(pre_save, sender=Video)
+def video_saving(sender, instance, **kwargs):
+    '''
+    resolves the embed codes once, rather than on every render
+    '''
+
+    resolve_video(instance)
+
+
+def refresh_video(video_id):
+    '''
+    resolves the video again along with its thumbnail,
+    which may need the network, and invalidates its
+    rendered output if its embed codes changed
+    '''
+
+    video = Video.objects.filter(id=video_id).first()
+    if video is None:
+        return
+    embeds = video.embeds
+    if not resolve_video(video, thumbnail=True):
+        return
+    changes = {'provider': video.provider,
+                'video_id': video.video_id,
+                'embeds': video.embeds,
+                'thumbnail_url': video.thumbnail_url}
+    if video.embeds != embeds:
+        changes['updated'] = timezone.now()
+    # unless the url was edited in the meantime
+    Video.objects.filter(id=video_id, url=video.url).update(**changes)
+    if 'updated' in changes:
+        bump_item_pages(Video, [video_id])
+
+
+@receiver(post_save, sender=Video)
+def video_saved(sender, instance, **kwargs):
+    video_id = instance.id
+    transaction.on_commit(lambda: tasks.submit(refresh_video, video_id))
+
+
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, **kwargs):
+    search.add_documents([search.course_document(instance)])
+
+
+@receiver(post_delete, sender=Course)
+def unindex_course(sender, instance, **kwargs):
+    search.remove_document(search.COURSE, instance.id)
+
+
+@receiver(post_save, sender=Module)
+def index_module(sender, instance, **kwargs):
+    search.add_documents([search.module_document(instance)])
+
+
+@receiver(post_delete, sender=Module)
+def unindex_module(sender, instance, **kwargs):
+    search.remove_document(search.MODULE, instance.id)
+
+
+@receiver(post_save, sender=Text)
+def index_text(sender, instance, **kwargs):
+    search.index_text(instance.id)
+
+
+@receiver(post_delete, sender=Text)
+def unindex_text(sender, instance, **kwargs):
+    search.remove_document(search.TEXT, instance.id)
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+def index_content_text(sender, instance, **kwargs):
+    '''
+    texts are indexed with the course displaying them
+    '''
+
+    if instance.content_type_id == ContentType.objects.get_for_model(Text).id:
+        search.index_text(instance.object_id)
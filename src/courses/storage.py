@@ -0,0 +1,125 @@
+'''
+content-addressed storage for the uploaded files.
+each upload is streamed in chunks while it is hashed,
+and stored once under its digest: uploading the same
+file again only returns the name of the existing blob,
+and refreshes it so it is not deleted meanwhile
+'''
+
+import hashlib
+import os
+import re
+import time
+from tempfile import NamedTemporaryFile
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+BLOB_NAME = re.compile(r'^(?:.*/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?$')
+
+# how long after being stored again an unreferenced blob is kept,
+# for the row of the upload that stored it to be committed
+RELEASE_GRACE_SECONDS = getattr(settings, 'MEDIA_RELEASE_GRACE_SECONDS', 60)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    chunk_size = 64 * 1024
+
+    def get_available_name(self, name, max_length=None):
+        '''
+        the final name only depends on the content,
+        and is chosen while saving it
+        '''
+
+        return name
+
+    def blob_name(self, name, digest):
+        '''
+        name of the blob of the given digest, kept in
+        the directory and with the extension of the upload
+        '''
+
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest[2:4], digest + extension)
+
+    def is_blob(self, name):
+        return bool(BLOB_NAME.match(name))
+
+    def write_temporary(self, content, digest=None):
+        '''
+        copies the content to a temporary file, feeding
+        the chunks to the digest, and returns its path
+        '''
+
+        os.makedirs(self.location, exist_ok=True)
+        with NamedTemporaryFile(dir=self.location, suffix='.upload', delete=False) as temporary:
+            if hasattr(content, 'seek'):
+                content.seek(0)
+            for chunk in content.chunks(self.chunk_size):
+                if digest is not None:
+                    digest.update(chunk)
+                temporary.write(chunk)
+        return temporary.name
+
+    def move_temporary(self, temporary, name):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_move_safe(temporary, path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+
+    def _save(self, name, content):
+        '''
+        copies the content to a temporary file while hashing
+        it, then moves it to its blob unless it already exists
+        '''
+
+        digest = hashlib.sha256()
+        temporary = self.write_temporary(content, digest)
+        name = self.blob_name(name, digest.hexdigest())
+        try:
+            # the same content is already stored, the blob
+            # is refreshed so it is not released meanwhile
+            os.utime(self.path(name))
+            os.remove(temporary)
+        except FileNotFoundError:
+            self.move_temporary(temporary, name)
+        return name.replace('\\', '/')
+
+    def delete_if_idle(self, name, idle_seconds=RELEASE_GRACE_SECONDS):
+        '''
+        deletes the blob unless it was stored again in the last
+        idle_seconds, and returns whether it was deleted. it is
+        moved aside first, so an upload of the same content either
+        finds it missing and stores it again, or refreshed it in time
+        '''
+
+        path = self.path(name)
+        aside = '{}.released'.format(path)
+        try:
+            os.rename(path, aside)
+        except FileNotFoundError:
+            return False
+        if time.time() - os.path.getmtime(aside) < idle_seconds:
+            # the content is the same if it was stored again meanwhile
+            os.replace(aside, path)
+            return False
+        os.remove(aside)
+        return True
+
+    def save_as(self, name, content):
+        '''
+        stores the content under the exact given name,
+        used for the files derived from a blob
+        '''
+
+        self.move_temporary(self.write_temporary(content), name)
+        return name
+
+
+content_storage = ContentAddressedStorage()
@@ -0,0 +1,43 @@
+'''
+runs slow work, like generating image derivatives,
+on a pool of worker threads of the current process
+so that requests do not wait for it
+'''
+
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=getattr(settings, 'BACKGROUND_WORKERS', 2))
+
+
+def run(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception('background task %s failed', func.__name__)
+        raise
+    finally:
+        # the worker threads have their own database connections
+        close_old_connections()
+
+
+def submit(func, *args, **kwargs):
+    '''
+    queues a call of func on the worker pool and returns its
+    future. tasks run right away when BACKGROUND_TASKS_EAGER is set
+    '''
+
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    return executor.submit(run, func, *args, **kwargs)
@@ -6,10 +6,18 @@ differently.
 '''
 
 from django import template
+from django.db.models import prefetch_related_objects
+from django.urls import reverse
+
+from courses.cache import render_items
+from courses.models import contents_prefetch
 
 
 register = template.Library()
 
+# reversed in place of the ids, which are then spliced into the url
+URL_PLACEHOLDER = 2147483647
+
 
 @register.filter
 def model_name(obj):
@@ -18,3 +26,50 @@ def model_name(obj):
         return obj._meta.model_name
     except AttributeError:
         return None
+
+
+def url_affixes(viewname, *args):
+    '''
+    the text before and after the last argument of the url,
+    so the url of each row is built without reversing it
+    '''
+
+    url = reverse(viewname, args=list(args) + [URL_PLACEHOLDER])
+    prefix, _, suffix = url.rpartition(str(URL_PLACEHOLDER))
+    return prefix, suffix
+
+
+@register.inclusion_tag('courses/content/list.html')
+def render_module_contents(module, editable=False):
+    '''
+    renders all the contents of the module in one pass: the
+    items are loaded with one query per type unless already
+    prefetched, and rendered from the render cache. the editable
+    listing of the instructors has the edit and delete forms
+    '''
+
+    if module is None:
+        return {'rows': [], 'editable': False}
+    prefetch_related_objects([module], contents_prefetch())
+    # each access to the generic foreign key looks up the content type,
+    # the contents whose item was deleted are left out
+    contents = [(content, content.item) for content in module.contents.all()]
+    contents = [(content, item) for content, item in contents if item is not None]
+    if not editable:
+        items = [item for content, item in contents]
+        return {'rows': [{'item': item, 'html': html}
+                            for item, html in zip(items, render_items(items))],
+                'editable': False}
+    delete_url = url_affixes('module-content-delete')
+    edit_urls = {}
+    rows = []
+    for content, item in contents:
+        name = item._meta.model_name
+        if name not in edit_urls:
+            edit_urls[name] = url_affixes('module-content-update', module.id, name)
+        rows.append({'content_id': content.id,
+                        'item': item,
+                        'model_name': name,
+                        'edit_url': str(item.id).join(edit_urls[name]),
+                        'delete_url': str(content.id).join(delete_url)})
+    return {'rows': rows, 'editable': True}
@@ -0,0 +1,389 @@
+'''
+export and import of whole course trees as JSON lines,
+one object per line: the subjects first, then each course
+followed by its modules, the items they display and their
+contents. both sides work by batches of courses so the
+memory used does not grow with the size of the dataset
+'''
+
+import json
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+from django.utils.dateparse import parse_datetime
+
+from .cache import bump_generation
+from .counters import change_count, iter_batches
+from .models import Subject, Course, Module, Content, Text, Video, Image, File
+from .storage import content_storage
+from .videos import resolve_video
+from . import search
+
+
+ITEM_MODELS = {'text': Text, 'video': Video, 'image': Image, 'file': File}
+
+# fields of each item model besides those of ItemBase
+ITEM_FIELDS = {'text': ['content'], 'video': ['url'], 'image': ['file'], 'file': ['file']}
+
+MEDIA_MODELS = ('image', 'file')
+
+
+def write_record(output, record):
+    output.write(json.dumps(record, cls=DjangoJSONEncoder) + '\n')
+
+
+def get_item_records(contents):
+    '''
+    the items displayed by the given contents,
+    loaded with one query per item model
+    '''
+
+    ids = {}
+    for content in contents:
+        model_name = ContentType.objects.get_for_id(content['content_type_id']).model
+        ids.setdefault(model_name, set()).add(content['object_id'])
+    items = {}
+    for model_name, object_ids in ids.items():
+        for item in (ITEM_MODELS[model_name].objects.filter(id__in=object_ids)
+                                                    .values('id', 'owner__username', 'title',
+                                                            *ITEM_FIELDS[model_name])):
+            record = {'model': model_name,
+                        'id': item.pop('id'),
+                        'owner': item.pop('owner__username')}
+            record.update(item)
+            items[model_name, record['id']] = record
+    return items
+
+
+def export_courses(output, batch_size=100, subjects=None, manifest=None):
+    '''
+    writes the course trees to the output, optionally only those
+    of the given subject slugs, and the stored files they use to
+    the manifest. returns the number of courses exported
+    '''
+
+    exported = 0
+    written_subjects = set()
+    for ids in iter_batches(Course, batch_size):
+        courses = Course.objects.filter(id__in=ids)
+        if subjects:
+            courses = courses.filter(subject__slug__in=subjects)
+        courses = list(courses.order_by('id').values('id', 'subject_id', 'owner__username',
+                                                        'title', 'slug', 'overview', 'created'))
+        if not courses:
+            continue
+        new_subjects = {course['subject_id'] for course in courses} - written_subjects
+        for subject in Subject.objects.filter(id__in=new_subjects).order_by('id').values(
+                                                                    'id', 'title', 'slug'):
+            write_record(output, dict(model='subject', **subject))
+        written_subjects |= new_subjects
+        course_ids = [course['id'] for course in courses]
+        modules = {}
+        for module in (Module.objects.filter(course_id__in=course_ids)
+                                        .order_by('course_id', 'order', 'id')
+                                        .values('id', 'course_id', 'title', 'description', 'order')):
+            modules.setdefault(module['course_id'], []).append(module)
+        contents = {}
+        for content in (Content.objects.filter(module__course_id__in=course_ids)
+                                        .order_by('module__course_id', 'module_id', 'order', 'id')
+                                        .values('id', 'module_id', 'module__course_id',
+                                                'content_type_id', 'object_id', 'order')):
+            contents.setdefault(content['module__course_id'], []).append(content)
+        items = get_item_records(content for course_contents in contents.values()
+                                            for content in course_contents)
+        for course in courses:
+            write_record(output, {'model': 'course',
+                                    'id': course['id'],
+                                    'subject': course['subject_id'],
+                                    'owner': course['owner__username'],
+                                    'title': course['title'],
+                                    'slug': course['slug'],
+                                    'overview': course['overview'],
+                                    # with the microseconds, unlike DjangoJSONEncoder
+                                    'created': course['created'].isoformat()})
+            for module in modules.get(course['id'], []):
+                write_record(output, {'model': 'module',
+                                        'id': module['id'],
+                                        'course': course['id'],
+                                        'title': module['title'],
+                                        'description': module['description'],
+                                        'order': module['order']})
+            course_contents = []
+            written_items = set()
+            for content in contents.get(course['id'], []):
+                key = (ContentType.objects.get_for_id(content['content_type_id']).model,
+                        content['object_id'])
+                if key not in items:
+                    # the item was deleted but not its content
+                    continue
+                if key not in written_items:
+                    # the items are written once per course
+                    write_record(output, items[key])
+                    written_items.add(key)
+                course_contents.append((key, content))
+            for (model_name, object_id), content in course_contents:
+                write_record(output, {'model': 'content',
+                                        'id': content['id'],
+                                        'module': content['module_id'],
+                                        'item_model': model_name,
+                                        'item': object_id,
+                                        'order': content['order']})
+            if manifest is not None:
+                write_media_manifest(manifest, [items[key] for key in written_items
+                                                if key[0] in MEDIA_MODELS])
+        exported += len(courses)
+    return exported
+
+
+def write_media_manifest(manifest, items):
+    '''
+    lists the stored files of the items, so they can be copied
+    along with the export. blobs keep their names everywhere
+    '''
+
+    for name in sorted({item['file'] for item in items if item['file']}):
+        size = content_storage.size(name) if content_storage.exists(name) else None
+        write_record(manifest, {'name': name, 'size': size})
+
+
+def missing_media(manifest):
+    '''
+    the files listed in the manifest that are not stored here
+    '''
+
+    return [record['name'] for record in read_records(manifest)
+            if not content_storage.exists(record['name'])]
+
+
+def read_records(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def import_courses(stream, batch_size=5000, default_owner=None):
+    '''
+    creates the course trees read from the stream, inserting
+    the objects of about batch_size records per transaction.
+    the subjects are matched by slug and the owners by username,
+    courses whose slug already exists are skipped. returns the
+    numbers of courses imported and skipped
+    '''
+
+    importer = CourseImporter(batch_size, default_owner)
+    for record in read_records(stream):
+        importer.add(record)
+    importer.flush()
+    return importer.imported, importer.skipped
+
+
+def reserve_ids(model, count):
+    '''
+    the next count primary keys of the model, taken from its
+    sequence within the transaction, so they are neither used
+    by a concurrent insert nor those of deleted rows
+    '''
+
+    if not count:
+        return iter(())
+    table = model._meta.db_table
+    column = model._meta.pk.column
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+                            'FROM generate_series(1, %s)', [table, column, count])
+            return iter([row[0] for row in cursor.fetchall()])
+        if connection.vendor == 'sqlite':
+            # the write lock of the transaction is held until the rows are
+            # inserted, and sqlite_sequence keeps the last id ever used
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+            sequence = cursor.fetchone()
+            cursor.execute('SELECT MAX({}) FROM {}'.format(connection.ops.quote_name(column),
+                                                            connection.ops.quote_name(table)))
+            last = max(sequence[0] if sequence else 0, cursor.fetchone()[0] or 0)
+            if sequence:
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s',
+                                [last + count, table])
+            else:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                                [table, last + count])
+            return iter(range(last + 1, last + 1 + count))
+    raise NotImplementedError('the ids cannot be reserved on {}'.format(connection.vendor))
+
+
+class CourseImporter(object):
+    '''
+    buffers the course trees and inserts them with bulk_create.
+    the primary keys are reserved from the sequences before
+    inserting, since most databases do not return the ids of
+    objects created in bulk, so the references between the new
+    objects can be set at once
+    '''
+
+    def __init__(self, batch_size, default_owner=None):
+        self.batch_size = batch_size
+        self.default_owner = default_owner
+        self.subjects = {}
+        self.owners = {}
+        self.trees = []
+        self.pending = 0
+        self.imported = 0
+        self.skipped = 0
+
+    def add(self, record):
+        model_name = record['model']
+        if model_name == 'subject':
+            self.add_subject(record)
+        elif model_name == 'course':
+            if self.pending >= self.batch_size:
+                # only complete trees are inserted together
+                self.flush()
+            self.trees.append({'course': record, 'module': [], 'item': [], 'content': []})
+        elif not self.trees:
+            raise ValueError('{} record outside of a course'.format(model_name))
+        else:
+            tree = self.trees[-1]
+            tree['item' if model_name in ITEM_MODELS else model_name].append(record)
+        self.pending += 1
+
+    def add_subject(self, record):
+        subject = Subject.objects.filter(slug=record['slug']).first()
+        if subject is None:
+            subject = Subject.objects.create(title=record['title'], slug=record['slug'])
+        self.subjects[record['id']] = subject.id
+
+    def get_owners(self, usernames):
+        '''
+        ids of the users with the given usernames
+        '''
+
+        missing = set(usernames) - set(self.owners)
+        self.owners.update(User.objects.filter(username__in=missing)
+                                        .values_list('username', 'id'))
+        for username in missing - set(self.owners):
+            if self.default_owner is None:
+                raise ValueError('unknown user {}'.format(username))
+            self.owners[username] = self.default_owner.id
+        return self.owners
+
+    def get_reference(self, ids, key, record, name):
+        '''
+        the new id of the object the record refers to
+        '''
+
+        try:
+            return ids[key]
+        except KeyError:
+            raise ValueError('{} {} refers to an unknown {}'.format(
+                                record['model'], record.get('id'), name))
+
+    def flush(self):
+        trees, self.trees, self.pending = self.trees, [], 0
+        if not trees:
+            return
+        existing = set(Course.objects.filter(
+                            slug__in=[tree['course']['slug'] for tree in trees])
+                                        .values_list('slug', flat=True))
+        self.skipped += sum(1 for tree in trees if tree['course']['slug'] in existing)
+        trees = [tree for tree in trees if tree['course']['slug'] not in existing]
+        if not trees:
+            return
+        with transaction.atomic():
+            self.insert(trees)
+        self.imported += len(trees)
+
+    def insert(self, trees):
+        owners = self.get_owners({tree['course']['owner'] for tree in trees} |
+                                    {item['owner'] for tree in trees for item in tree['item']})
+        course_ids = reserve_ids(Course, len(trees))
+        module_ids = reserve_ids(Module, sum(len(tree['module']) for tree in trees))
+        content_ids = reserve_ids(Content, sum(len(tree['content']) for tree in trees))
+        item_ids = {model_name: reserve_ids(model, sum(
+                                    1 for tree in trees for item in tree['item']
+                                    if item['model'] == model_name))
+                    for model_name, model in ITEM_MODELS.items()}
+
+        courses, modules, contents = [], [], []
+        items = {model_name: [] for model_name in ITEM_MODELS}
+        documents, created = [], {}
+        for tree in trees:
+            record = tree['course']
+            course = Course(id=next(course_ids),
+                            subject_id=self.get_reference(self.subjects, record['subject'],
+                                                            record, 'subject'),
+                            owner_id=owners[record['owner']],
+                            title=record['title'],
+                            slug=record['slug'],
+                            overview=record['overview'],
+                            module_count=len(tree['module']),
+                            content_count=len(tree['content']))
+            courses.append(course)
+            if record.get('created'):
+                created[course.id] = parse_datetime(record['created'])
+            documents.append(search.course_document(course))
+            # the ids are remapped within the tree
+            new_modules = {}
+            for record in tree['module']:
+                module = Module(id=next(module_ids),
+                                course_id=course.id,
+                                title=record['title'],
+                                description=record['description'],
+                                order=record.get('order'))
+                new_modules[record['id']] = module.id
+                modules.append(module)
+                documents.append(search.module_document(module))
+            new_items = {}
+            for record in tree['item']:
+                model_name = record['model']
+                item = ITEM_MODELS[model_name](id=next(item_ids[model_name]),
+                                                owner_id=owners[record['owner']],
+                                                title=record['title'],
+                                                **{field: record[field]
+                                                    for field in ITEM_FIELDS[model_name]})
+                new_items[model_name, record['id']] = item.id
+                items[model_name].append(item)
+                if model_name == 'text':
+                    documents.append((search.TEXT, item.id, course.id,
+                                        item.title, item.content))
+                elif model_name == 'video':
+                    # bulk_create skips the pre_save receiver
+                    resolve_video(item)
+            for record in tree['content']:
+                model_name = record['item_model']
+                if model_name not in ITEM_MODELS:
+                    raise ValueError('content {} displays an unknown model {}'.format(
+                                        record['id'], model_name))
+                contents.append(Content(
+                    id=next(content_ids),
+                    module_id=self.get_reference(new_modules, record['module'],
+                                                    record, 'module'),
+                    content_type=ContentType.objects.get_for_model(ITEM_MODELS[model_name]),
+                    object_id=self.get_reference(new_items, (model_name, record['item']),
+                                                    record, model_name),
+                    order=record.get('order')))
+
+        Course.objects.bulk_create(courses)
+        if created:
+            # the creation dates are overwritten by auto_now_add
+            Course.objects.filter(id__in=created).update(created=models.Case(
+                            *[models.When(id=id, then=models.Value(date))
+                                for id, date in created.items()],
+                            output_field=Course._meta.get_field('created')))
+        Module.objects.bulk_create(modules)
+        for model_name, model in ITEM_MODELS.items():
+            model.objects.bulk_create(items[model_name])
+        Content.objects.bulk_create(contents)
+
+        # bulk_create sends no signal: counters, index and caches
+        subject_counts = {}
+        for course in courses:
+            subject_counts[course.subject_id] = subject_counts.get(course.subject_id, 0) + 1
+        for subject_id, count in subject_counts.items():
+            change_count(Subject, [subject_id], 'course_count', count)
+        search.insert_documents(documents)
+        names = ['catalogue'] + ['subject_{}'.format(subject_id)
+                                    for subject_id in subject_counts]
+        transaction.on_commit(lambda: bump_generation(*names))
@@ -0,0 +1,92 @@
+'''
+embed codes and metadata of the videos, resolved once when
+a video is saved instead of on every render. the resolver is
+pluggable through VIDEO_RESOLVER: the default one relies on the
+backends of django-embed-video, whose thumbnail lookups may go
+to the network and are only done in the background
+'''
+
+import json
+import logging
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from embed_video.backends import detect_backend, EmbedVideoException
+from embed_video.templatetags.embed_video_tags import VideoNode
+
+
+logger = logging.getLogger(__name__)
+
+# sizes of the embed codes stored, as understood by the video tag
+EMBED_SIZES = getattr(settings, 'VIDEO_EMBED_SIZES', ('small', ))
+
+DEFAULT_SIZE = 'small'
+
+
+class EmbedVideoResolver(object):
+    '''
+    resolves the videos with the backends of django-embed-video
+    '''
+
+    def get_backend(self, url):
+        backend = detect_backend(url)
+        # the embedding pages may be served over HTTPS
+        backend.is_secure = True
+        return backend
+
+    def resolve(self, url):
+        '''
+        returns the provider, the id and the embed codes of
+        the video, without going to the network when the
+        provider allows it
+        '''
+
+        backend = self.get_backend(url)
+        embeds = {}
+        for size in EMBED_SIZES:
+            width, height = VideoNode.get_size(size)
+            embeds[size] = backend.get_embed_code(width=width, height=height)
+        return {'provider': backend.backend.replace('Backend', '').lower(),
+                'video_id': backend.code or '',
+                'embeds': embeds}
+
+    def get_thumbnail_url(self, url):
+        return self.get_backend(url).thumbnail or ''
+
+
+def get_resolver():
+    return import_string(getattr(settings, 'VIDEO_RESOLVER',
+                                    'courses.videos.EmbedVideoResolver'))()
+
+
+def resolve_video(video, thumbnail=False):
+    '''
+    stores the metadata of the video on the instance,
+    the thumbnail is only looked up if asked. returns
+    whether the video could be resolved
+    '''
+
+    resolver = get_resolver()
+    try:
+        metadata = resolver.resolve(video.url)
+        if thumbnail:
+            metadata['thumbnail_url'] = resolver.get_thumbnail_url(video.url)
+    except (EmbedVideoException, IOError):
+        # unknown providers or network errors, rendered by the video tag
+        logger.warning('could not resolve the video %s', video.url, exc_info=True)
+        video.provider = video.video_id = video.embeds = ''
+        return False
+    video.provider = metadata['provider']
+    video.video_id = metadata['video_id']
+    video.embeds = json.dumps(metadata['embeds'])
+    if 'thumbnail_url' in metadata:
+        video.thumbnail_url = metadata['thumbnail_url']
+    return True
+
+
+def get_embed_code(video, size=DEFAULT_SIZE):
+    if not video.embeds:
+        return ''
+    return mark_safe(json.loads(video.embeds).get(size, ''))
@@ -1,5 +1,8 @@
-from django.db.models import Count
+from django.db.models import Q
 from django.apps import apps
+from django.http import Http404
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import SuspiciousFileOperation
 from django.forms.models import modelform_factory
 from django.core.urlresolvers import reverse_lazy
 from django.shortcuts import redirect, get_object_or_404
@@ -11,18 +14,25 @@ from django.views.generic.edit import (CreateView,
                                         DeleteView)
 from django.contrib.auth.mixins import (LoginRequiredMixin,
                                         PermissionRequiredMixin)
-from django.core.cache import cache
 
 from braces.views import (CsrfExemptMixin,
                             JsonRequestResponseMixin)
 
-from .models import (Course, Module, Content, Subject)
+from .models import (Course, Module, Content, Subject, File, Image)
 from .forms import ModuleFormset
+from .cache import (get_generations, get_or_compute, bump_course_pages,
+                        get_enrolled_course_ids, CATALOGUE_CACHE_TIMEOUT)
+from .images import original_name
+from .media import serve_file
+from .search import search_courses
+from .storage import content_storage
+from .pagination import KeysetPaginator
+from .routers import ReplicaReadMixin
 
 from accounts.forms import CourseEnrollForm
 
 
-class CourseDetailView(DetailView):
+class CourseDetailView(ReplicaReadMixin, DetailView):
     model = Course
     template_name = 'courses/course/detail.html'
 
@@ -36,41 +46,104 @@ class CourseDetailView(DetailView):
         return context
 
 
-class CourseListView(TemplateResponseMixin, View):
+class CourseListView(ReplicaReadMixin, TemplateResponseMixin, View):
     model = Course
     template_name = 'courses/course/list.html'
+    keyset_paginator = KeysetPaginator(Course, ('-created', '-id'))
+
+    def get_subjects(self):
+        '''
+        retrieves all subjects with their total number of courses,
+        cached as plain rows until a subject or course changes
+        '''
+
+        generation, = get_generations('catalogue')
+        return get_or_compute('all_subjects',
+                                lambda: list(Subject.objects.values('id', 'title', 'slug',
+                                                                    'course_count')),
+                                CATALOGUE_CACHE_TIMEOUT, version=generation, name='catalogue')
+
+    def get_course_values(self, qs):
+        return qs.values('id', 'title', 'slug', 'created',
+                            'subject__title', 'subject__slug',
+                            'owner__first_name', 'owner__last_name',
+                            'module_count')
+
+    def get_course_rows(self, rows):
+        '''
+        compact rows of the courses displayed in the catalogue
+        '''
+
+        return [{'id': course['id'],
+                    'title': course['title'],
+                    'slug': course['slug'],
+                    'subject': {'title': course['subject__title'],
+                                'slug': course['subject__slug']},
+                    'module_count': course['module_count'],
+                    'owner_name': '{} {}'.format(
+                                    course['owner__first_name'],
+                                    course['owner__last_name']).strip()}
+                for course in rows]
+
+    def get_courses(self, subject=None, cursor=None):
+        '''
+        retrieves a page of all courses, or only of those of the
+        given subject, with their total number of modules
+        '''
+
+        if subject:
+            # dynamic key for caching dynamic data
+            generation, = get_generations('subject_{}'.format(subject['id']))
+            key = 'subject_{}_courses'.format(subject['id'])
+        else:
+            generation, = get_generations('catalogue')
+            key = 'all_courses'
+        if cursor:
+            # only the signed cursors of actual pages get this far
+            self.keyset_paginator.decode_cursor(cursor)
+            key = '{}_{}'.format(key, cursor)
+
+        def get_page():
+            qs = Course.objects.all()
+            if subject:
+                qs = qs.filter(subject_id=subject['id'])
+            rows, next_cursor = self.keyset_paginator.get_page(
+                                    self.get_course_values(qs), cursor)
+            return (self.get_course_rows(rows), next_cursor)
+
+        # the generation is checked by get_or_compute, so the previous
+        # page is served while a single worker computes the new one
+        return get_or_compute(key, get_page, CATALOGUE_CACHE_TIMEOUT,
+                                version=generation, name='catalogue')
+
+    def search_courses(self, query, subject=None):
+        '''
+        the courses best matching the query, best first
+        '''
+
+        course_ids = search_courses(query, subject_id=subject['id'] if subject else None)
+        qs = Course.objects.filter(id__in=course_ids)
+        courses = self.get_course_rows(self.get_course_values(qs))
+        return sorted(courses, key=lambda course: course_ids.index(course['id']))
 
     def get(self, request, subject=None):
-        # retrieves all subjects with their total number of courses
-        #subjects = Subject.objects.annotate(total_courses=Count('courses'))
-        # using low level API cache
-        subjects = cache.get('all_subjects')
-        if not subjects:
-            subjects = subjects = Subject.objects.annotate(total_courses=Count('courses'))
-            cache.set('all_subjects', subjects)
-        # retrieves all courses with their total number of modules
-        all_courses = Course.objects.annotate(total_modules=Count('modules'))
+        subjects = self.get_subjects()
         if subject:
             # subject slug is provided
-            subject = get_object_or_404(Subject, slug=subject)
-            # dynamic key for caching dynamic data
-            key = 'subject_{}_courses'.format(subject.id)
-            courses = cache.get(key)
-            #courses = courses.filter(subject=subject)
-            if not courses:
-                # cash courses filtered by subject
-                courses = all_courses.filter(subject=subject)
-                cache.set(key, courses)
+            subject = next((s for s in subjects if s['slug'] == subject), None)
+            if subject is None:
+                raise Http404('No subject matches the given query.')
+        query = request.GET.get('q', '').strip()
+        if query:
+            courses, next_cursor = self.search_courses(query, subject), None
         else:
-            # cach all courses
-            courses = cache.get('all_courses')
-            if not courses:
-                courses = all_courses
-                cache.set('all_courses', courses)
+            courses, next_cursor = self.get_courses(subject, request.GET.get('cursor'))
 
         context = {'subjects': subjects,
                     'subject': subject,
-                    'courses': courses}
+                    'query': query,
+                    'courses': courses,
+                    'next_cursor': next_cursor}
         return self.render_to_response(context)
 
 
@@ -136,6 +209,18 @@ class ManageCourseListView(OwnerCourseMixin, ListView):
     '''
 
     template_name = 'courses/manage/course/list.html'
+    keyset_paginator = KeysetPaginator(Course, ('-created', '-id'))
+
+    def get_context_data(self, **kwargs):
+        '''
+        only display one page of courses at a time
+        '''
+
+        object_list, next_cursor = self.keyset_paginator.get_page(
+                                        self.object_list,
+                                        self.request.GET.get('cursor'))
+        kwargs.update({'object_list': object_list, 'next_cursor': next_cursor})
+        return super(ManageCourseListView, self).get_context_data(**kwargs)
 
 
 class CourseCreateView(PermissionRequiredMixin, OwnerCourseEditMixin, CreateView):
@@ -291,23 +376,69 @@ class ModuleContentListView(TemplateResponseMixin, View):
     template_name = 'courses/manage/module/content_list.html'
 
     def get(self, request, module_id):
-        module = get_object_or_404(Module,
+        module = get_object_or_404(Module.objects.select_related('course')
+                                                    .with_contents(),
                                     id=module_id,
                                     course__owner=request.user)
         return self.render_to_response({'module': module})
 
 
 class ModuleOrderView(CsrfExemptMixin, JsonRequestResponseMixin, View):
+    require_json = True
+
     def post(self, request):
-        for id, order in self.request_json.items():
-            Module.objects.filter(id=id,
-                    course__owner=request.user).update(order=order)
-        return self.render_json_response({'saved': 'OK'})
+        try:
+            orders = Module.objects.filter(
+                        course__owner=request.user).reorder(self.request_json)
+        except (AttributeError, TypeError, ValueError):
+            return self.render_bad_request_response()
+        bump_course_pages(course_ids=Module.objects.filter(
+                                        id__in=orders).values_list(
+                                        'course_id', flat=True))
+        return self.render_json_response({'saved': 'OK', 'orders': orders})
 
 
 class ContentOrderView(CsrfExemptMixin, JsonRequestResponseMixin, View):
+    require_json = True
+
     def post(self, request):
-        for id, order in self.request_json.items():
-            Content.object.filter(id=id,
-                    module__course__owner=request.user).update(order=order)
-        return self.render_json_response({'saved': 'OK'})
+        try:
+            orders = Content.objects.filter(
+                        module__course__owner=request.user).reorder(self.request_json)
+        except (AttributeError, TypeError, ValueError):
+            return self.render_bad_request_response()
+        bump_course_pages(module_ids=Content.objects.filter(
+                                        id__in=orders).values_list(
+                                        'module_id', flat=True))
+        return self.render_json_response({'saved': 'OK', 'orders': orders})
+
+
+class MediaView(LoginRequiredMixin, View):
+    '''
+    serves the uploaded files to the owners of the
+    courses using them and to their enrolled students
+    '''
+
+    def has_access(self, user, name):
+        if user.is_staff:
+            return True
+        names = {name, original_name(name)}
+        query = Q(pk__in=[])
+        for model in (File, Image):
+            items = list(model.objects.filter(file__in=names).values_list('id', 'owner_id'))
+            if any(owner_id == user.id for item_id, owner_id in items):
+                return True
+            query |= Q(content_type=ContentType.objects.get_for_model(model),
+                        object_id__in=[item_id for item_id, owner_id in items])
+        enrolled = get_enrolled_course_ids(user)
+        return any(owner_id == user.id or course_id in enrolled
+                    for course_id, owner_id in Content.objects.filter(query).order_by().values_list(
+                                                'module__course_id', 'module__course__owner_id'))
+
+    def get(self, request, path):
+        if not self.has_access(request.user, path):
+            raise Http404
+        try:
+            return serve_file(request, path, content_storage.path(path))
+        except (OSError, SuspiciousFileOperation):
+            raise Http404
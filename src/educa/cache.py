@@ -0,0 +1,282 @@
+'''
+two-tier cache backend: a bounded in-process LRU tier with a
+short timeout in front of a shared cache such as memcached, so
+the hot read-mostly values are neither fetched over the network
+nor unpickled on every request. only the keys starting with one
+of LOCAL_PREFIXES are kept in the process; writing one of them
+bumps its own version in the shared cache, which the other
+processes check at most every VERSION_CHECK_INTERVAL seconds
+before serving their copy. the keys of IMMUTABLE_PREFIXES are
+kept without a version, their value never changes. the values
+kept in the process are shared by its threads and must not be
+mutated
+'''
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+
+# the local tiers of the process by name, shared by the backend
+# instances of its threads
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class LocalTier(object):
+    '''
+    least recently used values of the process, bounded by
+    the total size of their pickles
+    '''
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        the [value, expires, size, version, checked] entry of the key
+        '''
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                self.discard(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, timeout, size, version):
+        with self.lock:
+            self.discard(key)
+            now = time.time()
+            self.entries[key] = [value, now + timeout, size, version, now]
+            self.size += size
+            while self.size > self.max_size:
+                self.discard(next(iter(self.entries)))
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class TieredCache(BaseCache):
+    '''
+    the LOCATION names the local tier, and the REMOTE option
+    the alias of the shared cache, e.g.
+
+        'default': {
+            'BACKEND': 'educa.cache.TieredCache',
+            'LOCATION': 'catalogue',
+            'OPTIONS': {'REMOTE': 'memcached',
+                        'LOCAL_PREFIXES': ('all_subjects', ),
+                        'IMMUTABLE_PREFIXES': ('item_render_', )},
+        }
+    '''
+
+    def __init__(self, name, params):
+        super(TieredCache, self).__init__(params)
+        options = params.get('OPTIONS', {})
+        self.remote_alias = options['REMOTE']
+        self.versioned = tuple(options.get('LOCAL_PREFIXES', ()))
+        self.immutable = tuple(options.get('IMMUTABLE_PREFIXES', ()))
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.max_entry_size = options.get('MAX_ENTRY_SIZE', 1024 * 1024)
+        self.check_interval = options.get('VERSION_CHECK_INTERVAL', 1)
+        with _tiers_lock:
+            if name not in _tiers:
+                _tiers[name] = LocalTier(options.get('MAX_SIZE', 32 * 1024 * 1024))
+            self.tier = _tiers[name]
+
+    @property
+    def remote(self):
+        return caches[self.remote_alias]
+
+    def is_versioned(self, key):
+        return key.startswith(self.versioned)
+
+    def is_local(self, key):
+        return key.startswith(self.versioned) or key.startswith(self.immutable)
+
+    def version_key(self, key):
+        return 'tier_version_{}'.format(key)
+
+    def get_versions(self, keys, version=None):
+        '''
+        the versions of the given keys in the shared cache,
+        None for those never written
+        '''
+
+        keys = [key for key in keys if self.is_versioned(key)]
+        if not keys:
+            return {}
+        versions = self.remote.get_many([self.version_key(key) for key in keys],
+                                        version=version)
+        return {key: versions.get(self.version_key(key)) for key in keys}
+
+    def bump_version(self, key, version=None):
+        '''
+        invalidates the value of the key kept by every process
+        '''
+
+        version_key = self.version_key(key)
+        try:
+            return self.remote.incr(version_key, version=version)
+        except ValueError:
+            # not in the cache, starts from the current time
+            # so it never goes back to an old value
+            key_version = int(time.time() * 1000)
+            self.remote.set(version_key, key_version, None, version=version)
+            return key_version
+
+    def get_local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.local_timeout
+        return min(self.local_timeout, timeout)
+
+    def keep(self, key, value, version, key_version, timeout=DEFAULT_TIMEOUT):
+        '''
+        keeps the value in the process if its key is local and it
+        is small enough, along with the version it was read at
+        '''
+
+        if not self.is_local(key):
+            return
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size <= self.max_entry_size:
+            self.tier.set((key, version), value, self.get_local_timeout(timeout),
+                            size, key_version)
+
+    def lookup_many(self, keys, version):
+        '''
+        the values kept in the process for the keys, the
+        versions of those not checked lately are checked at once
+        '''
+
+        entries = {}
+        for key in keys:
+            if self.is_local(key):
+                entry = self.tier.get((key, version))
+                if entry is not None:
+                    entries[key] = entry
+        now = time.time()
+        unchecked = [key for key, entry in entries.items()
+                        if self.is_versioned(key) and now - entry[4] >= self.check_interval]
+        for key, key_version in self.get_versions(unchecked, version).items():
+            entry = entries[key]
+            if key_version == entry[3]:
+                entry[4] = now
+            else:
+                with self.tier.lock:
+                    self.tier.discard((key, version))
+                del entries[key]
+        return {key: entry[0] for key, entry in entries.items()}
+
+    def fetch_many(self, keys, version):
+        '''
+        reads the values from the shared cache and keeps them.
+        their versions are read first, so a value overwritten in
+        between is kept with an outdated version
+        '''
+
+        versions = self.get_versions(keys, version)
+        values = self.remote.get_many(keys, version=version)
+        for key, value in values.items():
+            self.keep(key, value, version, versions.get(key))
+        return values
+
+    def written(self, keys, version):
+        '''
+        drops the written keys from the local tiers, and
+        returns the new versions of those kept in the process
+        '''
+
+        versions = {}
+        for key in keys:
+            if self.is_local(key):
+                with self.tier.lock:
+                    self.tier.discard((key, version))
+                if self.is_versioned(key):
+                    versions[key] = self.bump_version(key, version)
+        return versions
+
+    def get(self, key, default=None, version=None):
+        values = self.get_many([key], version=version)
+        return values.get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = self.lookup_many(keys, version)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            values.update(self.fetch_many(missing, version))
+        return values
+
+    def get_shared(self, key, default=None, version=None):
+        '''
+        the value of the shared cache, past the copy kept
+        by the process, which may not be checked yet
+        '''
+
+        value = self.fetch_many([key], version).get(key)
+        return default if value is None else value
+
+    def has_key(self, key, version=None):
+        return bool(self.lookup_many([key], version)) or self.remote.has_key(key, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.remote.add(key, value, timeout, version=version)
+        if added:
+            versions = self.written([key], version)
+            self.keep(key, value, version, versions.get(key), timeout)
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.remote.set(key, value, timeout, version=version)
+        versions = self.written([key], version)
+        self.keep(key, value, version, versions.get(key), timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.remote.set_many(data, timeout, version=version) or []
+        versions = self.written(data, version)
+        for key, value in data.items():
+            if key not in failed:
+                self.keep(key, value, version, versions.get(key), timeout)
+        return failed
+
+    def delete(self, key, version=None):
+        self.remote.delete(key, version=version)
+        self.written([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.remote.delete_many(keys, version=version)
+        self.written(keys, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.remote.incr(key, delta, version=version)
+        self.written([key], version)
+        return value
+
+    def clear(self):
+        self.remote.clear()
+        self.tier.clear()
+
+    def close(self, **kwargs):
+        # the shared cache is an alias of its own, closed along with
+        # the others, and must not be created while they are closed
+        pass
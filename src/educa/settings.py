@@ -48,11 +48,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'courses.instrumentation.InstrumentationMiddleware', # first, to time the others
+    'courses.routers.ReplicaPinningMiddleware', # before the session writes
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.cache.UpdateCacheMiddleware', # per-site cache one
+    'courses.cache.UpdateCacheMiddleware', # per-site cache one
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware', # per-site cache two
+    'courses.cache.FetchFromCacheMiddleware', # per-site cache two
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -85,11 +87,38 @@ WSGI_APPLICATION = 'educa.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # WAL mode, tuned pragmas and retries when locked, see educa/sqlite3
+        'ENGINE': 'educa.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # connections are reused across the requests of a thread
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            'pragmas': {'busy_timeout': 5000},
+            'transaction_mode': 'IMMEDIATE',
+            'lock_retries': 5,
+        },
     }
 }
 
+# read replicas of the catalogue, given as a comma separated list of
+# SQLite files, e.g. a copy of db.sqlite3 made by the sync_replicas command
+DATABASE_REPLICAS = []
+for index, path in enumerate(filter(None, os.environ.get('EDUCA_READ_REPLICAS', '').split(','))):
+    alias = 'replica_{}'.format(index)
+    DATABASES[alias] = {
+        'ENGINE': 'educa.sqlite3',
+        'NAME': path,
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['courses.routers.ReplicaRouter']
+
+# seconds a client reads from the primary after writing
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -137,10 +166,23 @@ LOGIN_REDIRECT_URL = reverse_lazy('user-course-list')
 # Cashing contents
 
 CACHES = {
+    # the hot catalogue values and rendered items are kept
+    # for a few seconds in each process, in front of memcached
     'default': {
+        'BACKEND': 'educa.cache.TieredCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'REMOTE': 'memcached',
+            'LOCAL_PREFIXES': ('all_subjects', 'all_courses', 'subject_'),
+            'IMMUTABLE_PREFIXES': ('item_render_', ),
+            'LOCAL_TIMEOUT': 5,
+            'MAX_SIZE': 64 * 1024 * 1024,
+        },
+    },
+    'memcached': {
         'BACKEND':'django.core.cache.backends.memcached.MemcachedCache',
         'LOCATION':'127.0.0.1:11211',
-    }
+    },
 }
 
 # caching the whole site for all GET requests.
@@ -148,6 +190,26 @@ CACHES = {
 CACHE_MIDDLEWARE_ALIAS = 'default'
 CACHE_MIDDLEWARE_SECONDS = 60 * 15 # 15 minutes
 CACHE_MIDDLEWARE_KEY_PREFIX = 'educa'
+# expired pages and catalogue values are served for up to a minute
+# while a single worker computes them again
+CACHE_STALE_SECONDS = 60
+CACHE_LOCK_SECONDS = 10
+
+# per-request queries, cache usage and timings, see /api/instrumentation/,
+# turned on by the tests and benchmarks
+REQUEST_INSTRUMENTATION = DEBUG
+# maximum number of queries of the main views, checked by the tests
+QUERY_BUDGETS = {
+    'course-list': 4,
+    'course-list-subject': 4,
+    'course-detail': 6,
+    'module-content-list': 10,
+    'user-course-detail': 12,
+    'user-course-detail-module': 12,
+    'api:course-list': 4,
+    'api:course-detail': 4,
+    'api:course-contents': 10,
+}
 
 # setting the default permission class 
 REST_FRAMEWORK = {
@@ -0,0 +1,98 @@
+'''
+SQLite backend for the production deployment: write-ahead
+logging so the readers are never blocked by a writer, tuned
+pragmas applied to every new connection, transactions taking
+the write lock up front, and statements retried with backoff
+when the database is locked outside of a transaction
+'''
+
+import random
+import time
+
+from django.db.backends.sqlite3 import base
+
+
+# applied in this order to every new connection
+DEFAULT_PRAGMAS = (
+    ('journal_mode', 'wal'),
+    # durable at each checkpoint, safe from corruption with WAL
+    ('synchronous', 'normal'),
+    ('busy_timeout', 5000),
+    ('cache_size', -64000),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('temp_store', 'memory'),
+)
+
+Database = base.Database
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    retries = 0
+    retry_delay = 0.05
+
+    def execute(self, query, params=None):
+        return self.retry(super(SQLiteCursorWrapper, self).execute, query, params)
+
+    def executemany(self, query, param_list):
+        return self.retry(super(SQLiteCursorWrapper, self).executemany, query, param_list)
+
+    def retry(self, method, *args):
+        '''
+        runs the statement again, with exponential backoff,
+        while the database is locked by another connection.
+        inside a transaction the error is raised, since the
+        whole transaction must be run again
+        '''
+
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                return method(*args)
+            except Database.OperationalError as e:
+                if ('locked' not in str(e) or attempt == self.retries
+                        or self.connection.in_transaction):
+                    raise
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            delay *= 2
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    '''
+    the OPTIONS may set the pragmas, which are merged with
+    the defaults, the transaction_mode of BEGIN and the number
+    of lock_retries, the other options go to sqlite3.connect
+    '''
+
+    def get_connection_params(self):
+        kwargs = super(DatabaseWrapper, self).get_connection_params()
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        self.pragmas.update(kwargs.pop('pragmas', {}))
+        self.transaction_mode = kwargs.pop('transaction_mode', 'IMMEDIATE')
+        self.lock_retries = kwargs.pop('lock_retries', 5)
+        self.lock_retry_delay = kwargs.pop('lock_retry_delay', 0.05)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super(DatabaseWrapper, self).get_new_connection(conn_params)
+        cursor = conn.cursor()
+        try:
+            for name, value in self.pragmas.items():
+                cursor.execute('PRAGMA {} = {}'.format(name, value))
+        finally:
+            cursor.close()
+        return conn
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=SQLiteCursorWrapper)
+        cursor.retries = self.lock_retries
+        cursor.retry_delay = self.lock_retry_delay
+        return cursor
+
+    def _start_transaction_under_autocommit(self):
+        '''
+        an IMMEDIATE transaction takes the write lock when it
+        starts, waiting for it with the busy timeout, instead of
+        failing when a read lock cannot be upgraded
+        '''
+
+        self.cursor().execute('BEGIN {}'.format(self.transaction_mode or '').strip())
@@ -1,10 +1,9 @@
 from django.conf import settings
-from django.conf.urls.static import static
 from django.conf.urls import url, include
 from django.contrib import admin
 from django.contrib.auth import views as auth_views
 
-from courses.views import CourseListView
+from courses.views import CourseListView, MediaView
 
 
 urlpatterns = [
@@ -17,5 +16,8 @@ urlpatterns = [
     url(r'^api/', include('courses.api.urls', namespace='api')),
 ]
 
-# uploading and serving static files for development
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# serving the uploaded files to the enrolled users
+urlpatterns += [
+    url(r'^{}(?P<path>.+)$'.format(settings.MEDIA_URL.lstrip('/')),
+        MediaView.as_view(), name='media'),
+]